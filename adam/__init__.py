@@ -13,6 +13,8 @@ This package contains:
  * ADAM6251 device class - ADAM-6251 is a 16-ch Digital input Modbus TCP Module
  * ADAM6256 device class - ADAM-6256 is a 16-ch Digital Output Modbus
     TCP Module
+ * ADAMFleet device class - applies named output patterns to many ADAM
+    devices in parallel
 
 For more information and documentation of the device visit http://www.advantech.com/products/ethernet-i-o-modules-with-daisy-chain-adam-6200/sub_7447e150-338d-402d-b5a1-c9ce6d98816e
 """
@@ -20,8 +22,12 @@ For more information and documentation of the device visit http://www.advantech.
 
 from setuptools import find_packages
 
-__all__ = ['adam', 'adam_6217','adam_6224', 'adam_6250', 'adam_6251',
-           'adam_6256', 'run_server', 'version']
+__all__ = ['acquisition', 'adam', 'adam_6217','adam_6224', 'adam_6250',
+           'adam_6251', 'adam_6256', 'adam_aggregator', 'adam_fleet',
+           'alarms', 'broker', 'calibration', 'configuration', 'connection',
+           'expressions', 'filters', 'io_worker', 'ramps', 'registers',
+           'registry', 'run_server', 'scheduler', 'snapshot', 'state',
+           'version']
 __doc__ = ""
 __author__ = "Patryk Fraczek"
 __author_email__ = "pat.fraczekC@gmail.com"
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Register groups read from ADAM modules and the read-through cache used
+    by on-demand acquisition.
+
+    Every device class lists its register groups as (name, kind, address,
+    count) tuples in register_groups, where kind is 'coils' or 'registers',
+    and maps attribute names (without _N channel suffix) to the groups they
+    are computed from in attribute_groups. Data of groups is kept in the
+    state store of the device (see state module). Reads are executed by the
+    IOWorker of the device (its connected_ADAM). Data are stored, and
+    functions in listeners called with names of the stored groups, under the
+    monitor of the device (its monitor method), so they do not race with
+    client requests.
+
+    Groups listed in config_groups of the device class (e.g. Type Codes)
+    hold configuration of the module: they are read at connection, by
+    poll_config on a slow timer and after the device writes them, but not in
+    polling cycles or on-demand refreshes.
+"""
+
+import threading
+import time
+
+from registers import coalesce_blocks
+from io_worker import IOWorker
+
+__all__ = ["ReadThroughCache", "Acquisition"]
+
+
+READ_METHODS = {'coils': 'read_coils', 'registers': 'read_holding_registers'}
+
+
+class ReadThroughCache(object):
+    """Age of register groups with single-flight refresh: callers refreshing
+    groups which are already being fetched wait for that fetch instead of
+    starting another one, and get its exception if it fails."""
+
+    def __init__(self, fetch):
+        self.fetch = fetch
+        self.lock = threading.Lock()
+        self.timestamps = {}
+        self.in_flight = {}
+
+    def mark(self, names, timestamp=None):
+        """Record that groups were read at timestamp (default now)"""
+        timestamp = timestamp or time.time()
+        with self.lock:
+            for name in names:
+                self.timestamps[name] = timestamp
+
+    def invalidate(self, names):
+        """Forget timestamps of groups, so they are fetched again"""
+        with self.lock:
+            for name in names:
+                self.timestamps.pop(name, None)
+
+    def age(self, name):
+        """Return age of group in seconds, None if it was never read"""
+        timestamp = self.timestamps.get(name)
+        if timestamp is None:
+            return None
+        return time.time() - timestamp
+
+    def refresh(self, names, max_age):
+        """Fetch, in one call, all groups older than max_age seconds which
+        are not being fetched already, then wait for the remaining ones"""
+        stale = []
+        waiting = set()
+        now = time.time()
+        with self.lock:
+            for name in names:
+                timestamp = self.timestamps.get(name)
+                if timestamp is not None and now - timestamp <= max_age:
+                    continue
+                if name in self.in_flight:
+                    waiting.add(self.in_flight[name])
+                else:
+                    stale.append(name)
+            if stale:
+                event = threading.Event()
+                event.error = None
+                for name in stale:
+                    self.in_flight[name] = event
+        if stale:
+            try:
+                self.fetch(stale)
+                self.mark(stale)
+            except Exception as e:
+                event.error = e
+                raise
+            finally:
+                with self.lock:
+                    for name in stale:
+                        del self.in_flight[name]
+                event.set()
+        for event in waiting:
+            event.wait()
+            if event.error is not None:
+                raise event.error
+
+
+class Acquisition(object):
+    """Reads register groups of a device, either all at once (polling) or
+    only those needed by requested attributes (on-demand). Groups read
+    together are coalesced into as few transactions as possible: only
+    adjacent ones, unless coil_gap or register_gap of the device class
+    allows reading across gaps of up to that many addresses. Gaps must only
+    span addresses the module maps, otherwise it answers with Illegal Data
+    Address."""
+
+    coil_gap = 0
+    register_gap = 0
+
+    def __init__(self, device):
+        self.device = device
+        self.groups = dict((group[0], group[1:])
+                           for group in device.register_groups)
+        self.order = [group[0] for group in device.register_groups]
+        self.config_groups = [name for name in self.order
+                              if name in getattr(device, 'config_groups', ())]
+        self.poll_order = [name for name in self.order
+                           if name not in self.config_groups]
+        self.attribute_groups = device.attribute_groups
+        self.gaps = {'coils': getattr(device, 'coil_gap', self.coil_gap),
+                     'registers': getattr(device, 'register_gap',
+                                          self.register_gap)}
+        self.cache = ReadThroughCache(self.fetch)
+        self.lock = threading.Lock()
+        self.polling = False
+        self.listeners = []
+
+    def plan(self, names):
+        """Return coalesced reads (method, address, count) covering groups"""
+        reads = []
+        for kind in ('coils', 'registers'):
+            blocks = [self.groups[name][1:] for name in names
+                      if self.groups[name][0] == kind]
+            method = READ_METHODS[kind]
+            reads.extend((method, address, count) for address, count
+                         in coalesce_blocks(blocks, self.gaps[kind]))
+        return reads
+
+    def store(self, names, reads, requests):
+        """Split results of finished requests of coalesced reads into groups
+        and store them in the device state, with time of the response, the
+        caller holds the device monitor"""
+        for name in names:
+            kind, start, length = self.groups[name]
+            for (method, address, count), request in zip(reads, requests):
+                if method == READ_METHODS[kind] and \
+                        address <= start < address + count:
+                    result = request.wait()
+                    values = result.bits if kind == 'coils' \
+                        else result.registers
+                    self.device.state.update(
+                        name, values[start - address:start - address + length],
+                        request.time)
+                    break
+        for listener in self.listeners:
+            listener(names)
+
+    def fetch(self, names, priority=IOWorker.READ):
+        """Read register groups in coalesced transactions, queued at once in
+        the I/O worker of the device, and store their data"""
+        worker = self.device.connected_ADAM
+        reads = self.plan(names)
+        requests = [worker.submit(priority, worker.execute, *read)
+                    for read in reads]
+        for request in requests:
+            request.wait()
+        with self.device.monitor():
+            self.store(names, reads, requests)
+
+    def heartbeat(self):
+        """Return read (method, address, count) of one coil or register of
+        first group, used by the I/O worker to check the module is alive"""
+        kind, address, count = self.groups[self.order[0]]
+        return READ_METHODS[kind], address, 1
+
+    def read_all(self):
+        """Read all register groups"""
+        self.fetch(self.order)
+        self.cache.mark(self.order)
+
+    def poll(self):
+        """Queue reads of all register groups with polling priority without
+        waiting for them. Data is stored by the delivery thread of the I/O
+        worker once all reads are done. Returns False if previous poll is still in progress."""
+        with self.lock:
+            if self.polling:
+                return False
+            self.polling = True
+        self.queue_reads(self.poll_order, self.poll_done)
+        return True
+
+    def poll_config(self):
+        """Queue reads of configuration groups with polling priority
+        without waiting for them"""
+        if self.config_groups:
+            self.queue_reads(self.config_groups)
+
+    def queue_reads(self, names, callback=None):
+        """Queue coalesced reads of groups and storing of their data"""
+        worker = self.device.connected_ADAM
+        reads = self.plan(names)
+        requests = [worker.submit(IOWorker.POLL, worker.execute, *read)
+                    for read in reads]
+        worker.deliver(self.finish_poll, worker, names, reads, requests,
+                       callback=callback)
+
+    def finish_poll(self, worker, names, reads, requests):
+        """Store results of queued poll reads, executed by the delivery
+        thread of the I/O worker, unless it was closed meanwhile"""
+        try:
+            for request in requests:
+                request.wait()
+            with self.device.monitor():
+                if worker.closed:
+                    return
+                self.store(names, reads, requests)
+                self.cache.mark(names)
+        except Exception as e:
+            if not worker.closed:
+                self.device.error_stream("Polling failed: %s" % e)
+
+    def poll_done(self, request):
+        self.polling = False
+
+    def timestamp(self, attribute):
+        """Return time of the oldest response among groups of attribute
+        (without _N channel suffix), 0 if some of them were never read.
+        Configuration groups count only when no other group is needed."""
+        names = self.attribute_groups.get(attribute, ())
+        timestamps = [self.device.state.timestamp(name) for name in names]
+        if not all(timestamps):
+            return 0.0
+        return min([t for name, t in zip(names, timestamps)
+                    if name not in self.config_groups]
+                   or timestamps or [0.0])
+
+    def is_config(self, attribute):
+        """Return True if attribute (without _N channel suffix) is computed
+        only from configuration groups"""
+        names = self.attribute_groups.get(attribute, ())
+        return bool(names) and all(name in self.config_groups
+                                   for name in names)
+
+    def groups_for(self, attributes):
+        """Return names of register groups needed by attributes"""
+        names = set()
+        for attr in attributes:
+            if attr not in self.attribute_groups:
+                attr = attr.split('_')[0]
+            names.update(self.attribute_groups.get(attr, ()))
+        return [name for name in self.order if name in names]
+
+    def refresh(self, attributes, max_age):
+        """Read groups needed by attributes which are older than max_age"""
+        self.cache.refresh([name for name in self.groups_for(attributes)
+                            if name not in self.config_groups], max_age)
@@ -0,0 +1,522 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Base class of ADAM module devices.
+
+    ADAMDevice holds what devices of all ADAM modules have in common: the
+    connection through an I/O worker, polling in scheduler slots or
+    on-demand acquisition into the state store, derived channels, snapshot
+    publishing, attribute qualities and Save/Restore of configuration.
+    Device classes of modules define register groups, convert_values and
+    the attributes of their channels.
+"""
+
+__all__ = ["ADAMDevice"]
+
+# PyTango imports
+import tango
+from tango import DebugIt
+from tango.server import Device, DeviceMeta
+from tango.server import attribute, command
+from tango.server import device_property
+from tango import AttrQuality, AttrWriteType, DevState
+
+# Additional import
+import time
+from pymodbus.exceptions import ModbusException
+from configuration import save_snapshot, load_snapshot, \
+    restore_configuration
+from acquisition import Acquisition
+from connection import connections
+from io_worker import IOWorker
+from registry import registry
+from expressions import DerivedChannels
+from scheduler import scheduler
+from snapshot import SnapshotWriter
+
+
+class ADAMDevice(Device):
+    """ ADAMDevice
+Base class of devices of ADAM modules, not exported by the server itself.
+"""
+    __metaclass__ = DeviceMeta
+    connected_ADAM = 0.0
+
+    # module name used in Status
+    model = 'ADAM'
+    # register groups (name, kind, address, count) read from device
+    register_groups = ()
+    # state store class of register_groups (see state_class), not named
+    # State which is the Tango command
+    state_type = None
+    # attributes with ALARM quality when their channel reports a problem
+    alarm_attributes = ()
+    # register groups needed by attributes
+    attribute_groups = {}
+    # register groups holding configuration, read at connection, every
+    # ConfigRefreshPeriod and after writes instead of in polling cycles
+    config_groups = ()
+    # configuration blocks (address, count) handled by Save/Restore commands
+    config_registers = ()
+    config_coils = ()
+    # register groups read back after RestoreConfiguration
+    restored_groups = ()
+    # unread addresses between groups read in one transaction, only where
+    # the module maps all of them
+    coil_gap = 0
+    register_gap = 0
+    # blocks (address, count) of registers changed by the module itself
+    # (e.g. counting down), whose read back is not checked by VerifyWrites
+    unverified_registers = ()
+
+    # -----------------
+    # Device Properties
+    # -----------------
+
+    Configuration = device_property(
+        dtype='str',
+        default_value="",
+        doc="Configuration snapshot stored by SaveConfiguration command"
+    )
+
+    BrokerSocket = device_property(
+        dtype='str',
+        default_value="",
+        doc="Unix socket path of local ADAM-broker process, if set the "
+            "module is accessed through the broker instead of directly"
+    )
+
+    AcquisitionMode = device_property(
+        dtype='str',
+        default_value="polling",
+        doc="polling - all registers are read every polling cycle, "
+            "on_demand - registers are read only when attributes are read "
+            "and cached data is older than MaxAge"
+    )
+
+    MaxAge = device_property(
+        dtype='double',
+        default_value=500.0,
+        doc="Maximum age (in milliseconds) of cached data served in "
+            "on_demand acquisition mode"
+    )
+
+    DerivedChannels = device_property(
+        dtype=(str,),
+        default_value=[],
+        doc="Derived channels, one per line in form Name = expression over "
+            "channels of the device, e.g. DeltaP = AnalogInput_0 - "
+            "AnalogInput_1, exposed as attributes"
+    )
+
+    VerifyWrites = device_property(
+        dtype='bool',
+        default_value=False,
+        doc="Read back written registers in the same transaction (Modbus "
+            "function 23, or a read of the written range where the module "
+            "lacks it) and fail writes the module did not accept"
+    )
+
+    SnapshotPath = device_property(
+        dtype='str',
+        default_value='',
+        doc="File (e.g. /dev/shm/adam-1) to which raw state of the module "
+            "is published after every acquisition cycle, for local readers "
+            "using snapshot.SnapshotReader, empty disables publishing"
+    )
+
+    SnapshotDepth = device_property(
+        dtype='int',
+        default_value=1,
+        doc="Number of latest snapshots kept in SnapshotPath"
+    )
+
+    AutoConnect = device_property(
+        dtype='bool',
+        default_value=False,
+        doc="Connect with device when the server starts"
+    )
+
+    PollingPeriod = device_property(
+        dtype='double',
+        default_value=500.0,
+        doc="Period (in milliseconds) of polling cycles in polling "
+            "acquisition mode"
+    )
+
+    PollingPhase = device_property(
+        dtype='double',
+        default_value=0.0,
+        doc="Offset (in milliseconds) of polling cycles from the wall-clock "
+            "grid of PollingPeriod, devices with equal period and phase "
+            "poll at the same instants"
+    )
+
+    DetectionTime = device_property(
+        dtype='double',
+        default_value=3000.0,
+        doc="Time (in milliseconds) in which a dead module or connection is "
+            "detected, the device goes to FAULT and the connection is "
+            "reopened: the half of it is the timeout of requests, in polling "
+            "acquisition mode a heartbeat read is sent after a quarter of it "
+            "without requests"
+    )
+
+    ConfigRefreshPeriod = device_property(
+        dtype='double',
+        default_value=60000.0,
+        doc="Period (in milliseconds) of reading configuration registers "
+            "(e.g. Type Codes), which are not read in polling cycles, in "
+            "polling acquisition mode, 0 (and on_demand mode) reads them "
+            "only at connection and after writes"
+    )
+
+    # ----------
+    # Attributes
+    # ----------
+
+    MissedSlots = attribute(
+        dtype='int',
+        access=AttrWriteType.READ,
+        doc="Number of polling slots skipped since connection, because "
+            "previous cycle was still running"
+    )
+
+    # ---------------
+    # General methods
+    # ---------------
+
+    def init_device(self):
+        """Initialise device and sets its state to STANDBY"""
+        Device.init_device(self)
+        self.state = self.state_type()
+        self.acquisition = Acquisition(self)
+        self.property_error = None
+        self.init_channels()
+        try:
+            self.derived = DerivedChannels(self.DerivedChannels)
+            self.derived.check_names(
+                set(self.attribute_groups) |
+                set(['ChannelAlarm', 'State', 'Status']) |
+                set(name[len('read_'):] for name in dir(self)
+                    if name.startswith('read_')))
+        except ValueError as e:
+            self.invalid_property('DerivedChannels', e)
+            self.derived = DerivedChannels([])
+        self.acquisition.attribute_groups = \
+            self.derived.attribute_groups(self.attribute_groups)
+        for name in self.derived.names:
+            self.add_attribute(tango.Attr(name, tango.DevDouble,
+                                          AttrWriteType.READ),
+                               self.read_derived)
+        if self.derived.names:
+            self.acquisition.listeners.append(self.evaluate_derived)
+        self.converted = self.convert_values()
+        self.converted_generation = self.state.generation
+        self.poll_job = None
+        self.dead = False
+        self.stale_age = max(self.DetectionTime,
+                             2 * self.PollingPeriod) / 1000.0
+        if self.AcquisitionMode == 'on_demand':
+            # cached data served up to MaxAge are not stale
+            self.stale_age = max(self.stale_age, self.MaxAge / 1000.0)
+        # configuration groups are read only every ConfigRefreshPeriod, or
+        # only at connection and after writes
+        self.config_age = None
+        if self.AcquisitionMode != 'on_demand' and \
+                self.ConfigRefreshPeriod > 0:
+            self.config_age = self.ConfigRefreshPeriod / 1000.0 + \
+                self.stale_age
+        self.snapshot = None
+        if self.SnapshotPath:
+            self.snapshot = SnapshotWriter(self.SnapshotPath,
+                                           self.register_groups,
+                                           self.SnapshotDepth)
+            self.acquisition.listeners.append(self.publish_snapshot)
+        registry.register(self)
+        if self.property_error:
+            self.set_state(DevState.FAULT)
+            self.set_status(self.property_error)
+            return
+        self.set_state(DevState.STANDBY)
+        self.set_status("%s in state STANDBY, ready to connect to device"
+                        % self.model)
+
+    def invalid_property(self, name, error):
+        """Record that property could not be parsed, the device stays in
+        FAULT and does not connect until it is fixed and the device
+        initialised again"""
+        self.property_error = "Invalid %s property: %s" % (name, error)
+
+    def init_channels(self):
+        """Prepare state of channels needed by convert_values, called by
+        init_device before values are converted first"""
+        pass
+
+    def delete_device(self):
+        """Disconnect from physical device before deleting instance"""
+        registry.unregister(self)
+        self.stop_jobs()
+        # devices left in FAULT by invalid properties never connected
+        if self.connected_ADAM:
+            self.connected_ADAM.close()
+        # polls delivered after close do not store (and publish) any more
+        if self.snapshot is not None:
+            self.snapshot.close()
+
+    def dev_state(self):
+        self.check_connection()
+        return Device.dev_state(self)
+
+    def dev_status(self):
+        self.check_connection()
+        return Device.dev_status(self)
+
+    def check_connection(self):
+        """Switch to FAULT when the I/O worker finds the module dead (its
+        last request failed) and back to ON once the module responds"""
+        state = self.get_state()
+        if state == DevState.ON and not self.connected_ADAM.alive:
+            self.dead = True
+            self.set_state(DevState.FAULT)
+            self.set_status("Module at %s does not respond, reconnecting"
+                            % self.DeviceAddress)
+        elif state == DevState.FAULT and self.dead and \
+                self.connected_ADAM.alive:
+            self.dead = False
+            self.set_state(DevState.ON)
+            self.set_status("Connected to device with IP: "
+                            + str(self.DeviceAddress))
+
+    def is_connected(self):
+        """Return True between ConnectWithDevice and disconnect, also while
+        the module does not respond"""
+        return self.get_state() == DevState.ON or self.dead
+
+    def stop_jobs(self):
+        """Remove jobs of device from poll scheduler"""
+        scheduler.remove(self.get_name())
+        scheduler.remove((self.get_name(), 'config'))
+
+    @command
+    @DebugIt()
+    def disconnect(self):
+        """Disconnect from device and sets state to STANDBY """
+        self.stop_jobs()
+        self.connected_ADAM.close()
+        self.dead = False
+        self.set_state(DevState.STANDBY)
+        self.set_status(
+            "Device disconnected form %s, set state to STANDBY, "
+            "ready to connect to device again" % self.model)
+
+    # ------------------
+    # Attributes methods
+    # ------------------
+
+    def read_MissedSlots(self):
+        if self.poll_job is None:
+            return 0
+        return self.poll_job.missed
+
+    def read_derived(self, attr):
+        attr.set_value_date_quality(*self.reading(attr.get_name()))
+
+    # --------------------
+    # Additional methods
+    # --------------------
+
+    def read_attr_hardware(self, attr_list):
+        """Prepare values of all attributes requested by client at once:
+        in on_demand acquisition mode refresh the register groups they need
+        in one coalesced fetch, then convert values if registers changed
+        since last request"""
+        if self.AcquisitionMode == 'on_demand' and self.is_connected():
+            attrs = self.get_device_attr()
+            self.acquisition.refresh(
+                [attrs.get_attr_by_ind(i).get_name() for i in attr_list],
+                self.MaxAge / 1000.0)
+        self.get_converted()
+
+    def monitor(self):
+        """Return context manager holding the Tango monitor of device, which
+        serialises client requests, for use outside Tango threads"""
+        return tango.AutoTangoMonitor(self)
+
+    def get_converted(self):
+        """Return converted values, converting registers first if they
+        changed since last conversion"""
+        if self.converted_generation != self.state.generation:
+            self.converted_generation = self.state.generation
+            self.converted = self.convert_values()
+        return self.converted
+
+    def convert_values(self):
+        """Return dict of converted values of attributes (without _N
+        channel suffix) computed from raw registers in state"""
+        return {}
+
+    def config_slot(self):
+        """Queue reading of configuration groups in scheduler slot"""
+        if self.is_connected():
+            self.acquisition.poll_config()
+
+    def poll_slot(self):
+        """Start polling cycle in scheduler slot, return False if previous
+        cycle is still running"""
+        if not self.is_connected():
+            return True
+        return self.acquisition.poll()
+
+    def write_group(self, name, address, values):
+        """Write registers of group and store them in state, with values
+        read back by the module if VerifyWrites is set"""
+        offset = address - self.acquisition.groups[name][1]
+        if not self.VerifyWrites:
+            if len(values) == 1:
+                self.connected_ADAM.write_register(address, values[0])
+            else:
+                self.connected_ADAM.write_registers(address, values)
+            self.state.write(name, offset, values)
+            return
+        read = self.connected_ADAM.write_registers_verified(address, values)
+        self.state.write(name, offset, read)
+        checked = [i for i in range(0, len(values))
+                   if not any(start <= address + i < start + count
+                              for start, count in self.unverified_registers)]
+        if [read[i] for i in checked] != [values[i] for i in checked]:
+            raise ModbusException("Module did not accept write of registers "
+                                  "%d-%d: %s read back as %s"
+                                  % (address, address + len(values) - 1,
+                                     list(values), read))
+
+    def publish_snapshot(self, names):
+        """Publish raw state to SnapshotPath in the acquisition cycle"""
+        self.snapshot.publish(self.state)
+
+    def evaluate_derived(self, names):
+        """Compute derived channels in the acquisition cycle"""
+        self.get_converted()
+
+    def channel_alarm(self, channel):
+        """Return True if channel of alarm_attributes reports a problem"""
+        return self.converted['ChannelAlarm'][channel]
+
+    def reading(self, name, channel=None):
+        """Return value of attribute (of channel) with time of the module
+        response and its quality: INVALID if data were never read or are
+        older than DetectionTime (or two polling periods, or MaxAge in
+        on_demand mode), or than ConfigRefreshPeriod for attributes of
+        configuration groups only, ALARM if channel_alarm reports a problem
+        of channel"""
+        value = self.converted[name]
+        if channel is not None:
+            value = value[channel]
+        timestamp = self.acquisition.timestamp(name)
+        max_age = self.config_age if self.acquisition.is_config(name) \
+            else self.stale_age
+        if not timestamp or max_age is not None and \
+                time.time() - timestamp > max_age:
+            quality = AttrQuality.ATTR_INVALID
+        elif name in self.alarm_attributes and self.channel_alarm(channel):
+            quality = AttrQuality.ATTR_ALARM
+        else:
+            quality = AttrQuality.ATTR_VALID
+        return value, timestamp or time.time(), quality
+
+    # --------
+    # Commands
+    # --------
+
+    @command
+    @DebugIt()
+    def ConnectWithDevice(self):
+        """
+         Connect with ADAM Module with IP address the same as DeviceAddress
+         property, read all its registers and sets its state to ON. Does
+         nothing if the device is already connected (e.g. by AutoConnect).
+        """
+        if self.property_error or self.is_connected():
+            return
+        try:
+            timeout = self.DetectionTime / 2000.0
+            # no Modbus traffic of an idle device in on_demand mode
+            heartbeat = None if self.AcquisitionMode == 'on_demand' \
+                else self.acquisition.heartbeat()
+            self.connected_ADAM = IOWorker(
+                connections.connect(self.DeviceAddress, self.BrokerSocket,
+                                    timeout),
+                self.get_name(), heartbeat, timeout)
+            try:
+                self.acquisition.read_all()
+            except Exception:
+                self.connected_ADAM.close()
+                raise
+        except ModbusException as e:
+            self.set_state(DevState.FAULT)
+            self.set_status("Modbus exception caught while"
+                            " connecting to device: \n%s" % e)
+            return
+        except Exception as e:
+            self.set_state(DevState.FAULT)
+            self.set_status("Exception caught while connecting to device:"
+                            + "\n%s" % e)
+            return
+        self.dead = False
+        self.set_state(DevState.ON)
+        if self.AcquisitionMode != 'on_demand':
+            self.poll_job = scheduler.add(self.get_name(), self.poll_slot,
+                                          self.PollingPeriod / 1000.0,
+                                          self.PollingPhase / 1000.0)
+            if self.acquisition.config_groups and \
+                    self.ConfigRefreshPeriod > 0:
+                scheduler.add((self.get_name(), 'config'), self.config_slot,
+                              self.ConfigRefreshPeriod / 1000.0)
+        self.set_status("Connected to device with IP: "
+                        + str(self.DeviceAddress))
+        self.info_stream("Connected to device with IP: "
+                         + str(self.DeviceAddress))
+
+    @command(dtype_in=str, doc_in='File name, empty to store snapshot in '
+                                  'Configuration property',
+             dtype_out=str, doc_out='Configuration snapshot')
+    @DebugIt()
+    def SaveConfiguration(self, value):
+        """
+         Read configuration registers and coils of the module and store
+         them
+        """
+        return save_snapshot(self, value)
+
+    @command(dtype_in=str, doc_in='File name, empty to restore snapshot from '
+                                  'Configuration property',
+             dtype_out=(str,), doc_out='Differences written to the module')
+    @DebugIt()
+    def RestoreConfiguration(self, value):
+        """
+         Write stored configuration to the module, changing only the
+         registers and coils which differ from the stored snapshot
+        """
+        differences = restore_configuration(self.connected_ADAM,
+                                            load_snapshot(self, value),
+                                            self.config_registers,
+                                            self.config_coils)
+        self.acquisition.fetch(self.restored_groups)
+        return differences
+
+    @command
+    def read_DataFromDevice(self):
+        """
+         Queue reading data from ADAM Module registers in the I/O worker,
+         behind any pending writes. Polling cycles are started by the
+         scheduler every PollingPeriod.
+        """
+        if self.is_connected() and self.AcquisitionMode != 'on_demand':
+            self.acquisition.poll()
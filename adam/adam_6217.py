@@ -21,14 +21,21 @@ from tango.server import attribute, command
 from tango.server import class_property, device_property
 from tango import AttrQuality, AttrWriteType, DispLevel, DevState, AttrDataFormat
 # Additional import
+import time
 
-from pymodbus.client.sync import ModbusTcpClient
 from pymodbus.exceptions import ModbusException
+from adam import ADAMDevice
+from registers import decode_longs, mask_span, StatusTable
+from state import state_class
+from registry import registry
+from alarms import AlarmEngine
+from calibration import RAW_VALUES, parse_calibrations, build_lut
+from filters import parse_filters
 #mport time
 
 
 
-class ADAM6217(Device):
+class ADAM6217(ADAMDevice):
     """ ADAM6217
 It is a definition of a class used to control ADAM-6217 controller via Modbus
 TCP.
@@ -53,22 +60,15 @@ For each AI there are associated attributes:
  * HighAlarmFlag(bool) - it is true if measuring value is above High alarm
  * LowAlarmFlag(bool) - it is true if measuring value is above Low alarm
 
+Statuses of all channels are also available as StatusMasks (int bit masks)
+and StatusFlags (bool per flag) attributes.
+
+Channels with filters defined in Filters property have FilteredInput_N
+(double) attribute with the filtered value.
+
 """
     __metaclass__ = DeviceMeta
-    connected_ADAM = 0.0
-
-    analog_input_values = [0, 0, 0, 0, 0, 0, 0, 0]
-    analog_input_statuses = [0, 0, 0, 0, 0, 0, 0, 0]    
-    analog_input_types = [0, 0, 0, 0, 0, 0, 0, 0]
-    analog_output_startup_values = [0, 0, 0, 0, 0, 0, 0, 0]
-    analog_output_safety_values = [0, 0, 0, 0, 0, 0, 0, 0]
-    hist_max = [0, 0, 0, 0, 0, 0, 0, 0]
-    hist_min =  [0, 0, 0, 0, 0, 0, 0, 0]
-    open_circuit_flags = [False, False, False, False, False, False, False, False]
-    reset_min = [False, False, False, False, False, False, False, False]
-    reset_max = [False, False, False, False, False, False, False, False]
-    high_alarm_flag = [False, False, False, False, False, False, False, False]
-    low_alarm_flag = [False, False, False, False, False, False, False, False]
+    model = 'ADAM-6217'
 
     type_to_code_dict = {'0-20mA': int("0182", 16), '4-20mA': int("0180", 16),
                            '0-10V': int("0148", 16), '0-5V': int("0147", 16),
@@ -84,8 +84,52 @@ For each AI there are associated attributes:
                      int(128): 'AD Converter failed',
                      int(512): 'Zero / Span Calibration Error',
                      int(0): ' '}
+    status_table_1 = StatusTable(status_dict_1)
     status_dict_1.update({v: k for k, v in status_dict_1.iteritems()})
 
+    # register groups (name, kind, address, count) read from device
+    register_groups = (
+        ('open_circuit_flags', 'coils', 120, 8),
+        ('low_alarm_flag', 'coils', 130, 8),
+        ('high_alarm_flag', 'coils', 140, 8),
+        ('analog_input_values', 'registers', 0, 8),
+        ('hist_max', 'registers', 10, 8),
+        ('hist_min', 'registers', 20, 8),
+        ('analog_input_statuses', 'registers', 100, 16),
+        ('analog_output_types', 'registers', 200, 8),
+    )
+    # raw values of register groups, one instance per device
+    state_type = state_class('ADAM6217State', register_groups)
+    # attributes with ALARM quality when their channel reports a problem
+    alarm_attributes = ('AnalogInput',)
+    # register groups needed by attributes
+    attribute_groups = {
+        'AnalogInput': ('analog_input_values', 'analog_output_types',
+                        'analog_input_statuses', 'open_circuit_flags',
+                        'low_alarm_flag', 'high_alarm_flag'),
+        'HistMax': ('hist_max', 'analog_output_types'),
+        'HistMin': ('hist_min', 'analog_output_types'),
+        'TypeCode': ('analog_output_types',),
+        'Status': ('analog_input_statuses',),
+        'StatusMasks': ('analog_input_statuses',),
+        'StatusFlags': ('analog_input_statuses',),
+        'OpenCircuitFlags': ('open_circuit_flags',),
+        'HighAlarmFlags': ('high_alarm_flag',),
+        'LowAlarmFlags': ('low_alarm_flag',),
+        'FilteredInput': ('analog_input_values', 'analog_output_types'),
+        'HighLimitMask': ('analog_input_values', 'analog_output_types'),
+        'LowLimitMask': ('analog_input_values', 'analog_output_types'),
+    }
+
+    # register groups holding configuration, read at connection, every
+    # ConfigRefreshPeriod and after writes instead of in polling cycles
+    config_groups = ('analog_output_types',)
+
+    # configuration blocks (address, count) handled by Save/Restore commands
+    config_registers = ((200, 8),)
+    config_coils = ()
+    restored_groups = ('analog_output_types',)
+
     # ----------------
     # Class Properties
     # ----------------
@@ -98,7 +142,47 @@ For each AI there are associated attributes:
     DeviceAddress = device_property(
         dtype='str',
         default_value="192.168.120.56",
-        doc = "This property contains an IP address of device"
+        doc="An IP address of device, optionally followed by Modbus TCP "
+            "port and unit ID (e.g. 192.168.120.10:502/3) to share one "
+            "connection of a gateway with other devices"
+    )
+
+    Calibrations = device_property(
+        dtype=(str,),
+        default_value=[],
+        doc="Calibration of channels applied on top of nominal range, one "
+            "channel per line: N: poly c0 c1 c2 ... or N: table x0:y0 "
+            "x1:y1 ..."
+    )
+
+    Filters = device_property(
+        dtype=(str,),
+        default_value=[],
+        doc="Filters of channels applied to every acquired sample, one "
+            "channel per line: N: stage argument, stage argument ..., with "
+            "stages average N, median N, iir alpha and decimate N, exposed "
+            "as FilteredInput_N attributes"
+    )
+
+    HighLimits = device_property(
+        dtype=(float,),
+        default_value=[],
+        doc="High alarm limits of channels evaluated by the device, one value "
+            "for all channels or one per channel, NaN disables the alarm"
+    )
+
+    LowLimits = device_property(
+        dtype=(float,),
+        default_value=[],
+        doc="Low alarm limits of channels evaluated by the device, one value "
+            "for all channels or one per channel, NaN disables the alarm"
+    )
+
+    Hysteresis = device_property(
+        dtype=(float,),
+        default_value=[0.0],
+        doc="Hysteresis of alarm limits, one value for all channels or one "
+            "per channel"
     )
 
     # ----------
@@ -406,30 +490,66 @@ For each AI there are associated attributes:
         doc="Bool values of Low Alarm Flag for channels"
     )
 
-    # ---------------
-    # General methods
-    # ---------------
+    StatusMasks = attribute(
+        dtype=(int,),
+        access=AttrWriteType.READ,
+        max_dim_x=8,
+        doc="Raw status bit masks of channels"
+    )
 
-    def init_device(self):
-        """Initialise device and sets its state to STANDBY"""
-        Device.init_device(self)
-        self.set_state(DevState.STANDBY)
-        self.set_status("ADAM-6217 enabled")
+    StatusFlags = attribute(
+        dtype=((bool,),),
+        access=AttrWriteType.READ,
+        max_dim_x=6,
+        max_dim_y=8,
+        doc="Status flags of channels (row - channel, column - flag in order "
+            "of Status description)"
+    )
 
-    def delete_device(self):
-        """Disconnect from physical device before deleting instance"""
-        self.connected_ADAM.close()
+    HighLimitMask = attribute(
+        dtype='int',
+        access=AttrWriteType.READ,
+        doc="Bit mask of channels above HighLimits (bit 0 - channel 0)"
+    )
 
+    LowLimitMask = attribute(
+        dtype='int',
+        access=AttrWriteType.READ,
+        doc="Bit mask of channels below LowLimits (bit 0 - channel 0)"
+    )
 
-    @command
-    @DebugIt()
-    def disconnect(self):
-        """Disconnect from device and sets state to STANDBY """
-        self.connected_ADAM.close()
-        self.set_state(DevState.STANDBY)
-        self.set_status(
-            "Device disconnected form ADAM-6217, set state to STANDBY, "
-            "ready to connect to device again")
+    # ---------------
+    # General methods
+    # ---------------
+
+    def init_channels(self):
+        try:
+            self.calibrations = parse_calibrations(self.Calibrations, 8)
+        except ValueError as e:
+            self.invalid_property('Calibrations', e)
+            self.calibrations = parse_calibrations([], 8)
+        self.luts = [None] * 8
+        self.lut_codes = [None] * 8
+        try:
+            self.filters = parse_filters(self.Filters, 8)
+        except ValueError as e:
+            self.invalid_property('Filters', e)
+            self.filters = parse_filters([], 8)
+        self.filtered = [float('nan')] * 8
+        for channel in range(0, 8):
+            if self.filters[channel] is not None:
+                self.add_attribute(
+                    tango.Attr('FilteredInput_%d' % channel, tango.DevDouble,
+                               AttrWriteType.READ),
+                    self.read_filtered)
+        if any(self.filters):
+            self.acquisition.listeners.append(self.apply_filters)
+        self.alarms = AlarmEngine(8, self.HighLimits, self.LowLimits,
+                                  self.Hysteresis)
+        self.acquisition.listeners.append(self.evaluate_alarms)
+        for name in ['HighLimitMask', 'LowLimitMask'] + \
+                ['AnalogInput_%d' % i for i in range(0, 8)]:
+            self.set_change_event(name, True, True)
 
     # ------------------
     # Attributes methods
@@ -440,182 +560,293 @@ For each AI there are associated attributes:
     # --------------------
 
     def read_AnalogInput_0(self):
-        return self.encode_value(self.analog_input_values[0], 0)
+        return self.reading('AnalogInput', 0)
 
     def read_AnalogInput_1(self):
-        return self.encode_value(self.analog_input_values[1], 1)
+        return self.reading('AnalogInput', 1)
 
     def read_AnalogInput_2(self):
-        return self.encode_value(self.analog_input_values[2], 2)
+        return self.reading('AnalogInput', 2)
 
     def read_AnalogInput_3(self):
-        return self.encode_value(self.analog_input_values[3], 3)
+        return self.reading('AnalogInput', 3)
     
     def read_AnalogInput_4(self):
-        return self.encode_value(self.analog_input_values[4], 4)
+        return self.reading('AnalogInput', 4)
 
     def read_AnalogInput_5(self):
-        return self.encode_value(self.analog_input_values[5], 5)
+        return self.reading('AnalogInput', 5)
 
     def read_AnalogInput_6(self):
-        return self.encode_value(self.analog_input_values[6], 6)
+        return self.reading('AnalogInput', 6)
     
     def read_AnalogInput_7(self):
-        return self.encode_value(self.analog_input_values[7], 7)
+        return self.reading('AnalogInput', 7)
 
     # --------------------
     # TypeCode methods
     # --------------------
 
     def read_TypeCode_0(self):
-        return self.decode_type_code(0)
+        return self.reading('TypeCode', 0)
 
     def read_TypeCode_1(self):
-        return self.decode_type_code(1)
+        return self.reading('TypeCode', 1)
 
     def read_TypeCode_2(self):
-        return self.decode_type_code(2)
+        return self.reading('TypeCode', 2)
 
     def read_TypeCode_3(self):
-        return self.decode_type_code(3)
+        return self.reading('TypeCode', 3)
     
     def read_TypeCode_4(self):
-        return self.decode_type_code(4)
+        return self.reading('TypeCode', 4)
 
     def read_TypeCode_5(self):
-        return self.decode_type_code(5)
+        return self.reading('TypeCode', 5)
 
     def read_TypeCode_6(self):
-        return self.decode_type_code(6)
+        return self.reading('TypeCode', 6)
     
     def read_TypeCode_7(self):
-        return self.decode_type_code(7)
+        return self.reading('TypeCode', 7)
 
     def write_TypeCode_0(self, value):
-        self.connected_ADAM.write_register(200, self.encode_type_code(value))
+        self.write_TypeCode(0, value)
 
     def write_TypeCode_1(self, value):
-        self.connected_ADAM.write_register(201, self.encode_type_code(value))
+        self.write_TypeCode(1, value)
 
     def write_TypeCode_2(self, value):
-        self.connected_ADAM.write_register(202, self.encode_type_code(value))
+        self.write_TypeCode(2, value)
 
     def write_TypeCode_3(self, value):
-        self.connected_ADAM.write_register(203, self.encode_type_code(value))
+        self.write_TypeCode(3, value)
 
     def write_TypeCode_4(self, value):
-        self.connected_ADAM.write_register(204, self.encode_type_code(value))
+        self.write_TypeCode(4, value)
 
     def write_TypeCode_5(self, value):
-        self.connected_ADAM.write_register(205, self.encode_type_code(value))
+        self.write_TypeCode(5, value)
 
     def write_TypeCode_6(self, value):
-        self.connected_ADAM.write_register(206, self.encode_type_code(value))
+        self.write_TypeCode(6, value)
 
     def write_TypeCode_7(self, value):
-        self.connected_ADAM.write_register(207, self.encode_type_code(value))
+        self.write_TypeCode(7, value)
+
+    def write_TypeCode(self, channel, value):
+        """Write Type Code of channel and read Type Codes back, so
+        conversions use the new one at once"""
+        self.write_group('analog_output_types', 200 + channel,
+                         [self.encode_type_code(value)])
+        if not self.VerifyWrites:
+            self.acquisition.fetch(['analog_output_types'])
 
     # --------------------
     # Flags methods
     # -------------------- 
 
     def read_OpenCircuitFlags(self):
-        return self.open_circuit_flags
-    
+        return self.reading('OpenCircuitFlags')
+
     def read_HighAlarmFlags(self):
-        return self.open_circuit_flags
-    
+        return self.reading('HighAlarmFlags')
+
     def read_LowAlarmFlags(self):
-        return self.open_circuit_flags
+        return self.reading('LowAlarmFlags')
 
     # --------------------
     # Historical Values methods
     # --------------------
 
     def read_HistMax_0(self):
-        return self.encode_value(self.hist_max[0], 0)
+        return self.reading('HistMax', 0)
 
     def read_HistMax_1(self):
-        return self.encode_value(self.hist_max[1], 1)
+        return self.reading('HistMax', 1)
 
     def read_HistMax_2(self):
-        return self.encode_value(self.hist_max[2], 2)
+        return self.reading('HistMax', 2)
 
     def read_HistMax_3(self):
-        return self.encode_value(self.hist_max[3], 3)
+        return self.reading('HistMax', 3)
 
     def read_HistMax_4(self):
-        return self.encode_value(self.hist_max[4], 4)
+        return self.reading('HistMax', 4)
 
     def read_HistMax_5(self):
-        return self.encode_value(self.hist_max[5], 5)
+        return self.reading('HistMax', 5)
 
     def read_HistMax_6(self):
-        return self.encode_value(self.hist_max[6], 6)
+        return self.reading('HistMax', 6)
 
     def read_HistMax_7(self):
-        return self.encode_value(self.hist_max[7], 7)
+        return self.reading('HistMax', 7)
     
     def read_HistMin_0(self):
-        return self.encode_value(self.hist_min[0], 0)
+        return self.reading('HistMin', 0)
 
     def read_HistMin_1(self):
-        return self.encode_value(self.hist_min[1], 1)
+        return self.reading('HistMin', 1)
 
     def read_HistMin_2(self):
-        return self.encode_value(self.hist_min[2], 2)
+        return self.reading('HistMin', 2)
 
     def read_HistMin_3(self):
-        return self.encode_value(self.hist_min[3], 3)
+        return self.reading('HistMin', 3)
 
     def read_HistMin_4(self):
-        return self.encode_value(self.hist_min[4], 4)
+        return self.reading('HistMin', 4)
 
     def read_HistMin_5(self):
-        return self.encode_value(self.hist_min[5], 5)
+        return self.reading('HistMin', 5)
 
     def read_HistMin_6(self):
-        return self.encode_value(self.hist_min[6], 6)
+        return self.reading('HistMin', 6)
 
     def read_HistMin_7(self):
-        return self.encode_value(self.hist_min[7], 7)
+        return self.reading('HistMin', 7)
 
     # --------------------
     # Status methods
     # --------------------
 
     def read_Status_0(self):
-        return self.status_dict_1[self.analog_input_statuses[0]]
+        return self.reading('Status', 0)
 
     def read_Status_1(self):
-        return self.status_dict_1[self.analog_input_statuses[2]]
+        return self.reading('Status', 1)
 
     def read_Status_2(self):
-        return self.status_dict_1[self.analog_input_statuses[4]]
+        return self.reading('Status', 2)
 
     def read_Status_3(self):
-        return self.status_dict_1[self.analog_input_statuses[6]]
+        return self.reading('Status', 3)
     
     def read_Status_4(self):
-        return self.status_dict_1[self.analog_input_statuses[8]]
+        return self.reading('Status', 4)
 
     def read_Status_5(self):
-        return self.status_dict_1[self.analog_input_statuses[10]]
+        return self.reading('Status', 5)
 
     def read_Status_6(self):
-        return self.status_dict_1[self.analog_input_statuses[12]]
+        return self.reading('Status', 6)
     
     def read_Status_7(self):
-        return self.status_dict_1[self.analog_input_statuses[14]]
+        return self.reading('Status', 7)
+
+    def read_StatusMasks(self):
+        return self.reading('StatusMasks')
+
+    def read_StatusFlags(self):
+        return self.reading('StatusFlags')
+
+    def channel_alarm(self, channel):
+        """Return True if status of channel, its open circuit or alarm
+        flags report a problem or its value is out of HighLimits/LowLimits"""
+        return self.converted['ChannelAlarm'][channel] or \
+            self.alarms.active[channel]
+
+    def evaluate_alarms(self, names):
+        """Evaluate limit alarms of all channels when their values were read
+        and push change events of channels whose alarms changed, called
+        under the device monitor"""
+        if 'analog_input_values' not in names:
+            return
+        changed = self.alarms.evaluate(
+            [self.lut(i)[self.state.analog_input_values[i]]
+             for i in range(0, 8)])
+        if not changed.any():
+            return
+        # masks are part of converted values
+        self.state.generation += 1
+        self.get_converted()
+        for name in ('HighLimitMask', 'LowLimitMask'):
+            self.push_change_event(name, *self.reading(name))
+        for channel in range(0, 8):
+            if changed[channel]:
+                self.push_change_event('AnalogInput_%d' % channel,
+                                       *self.reading('AnalogInput', channel))
+
+    def read_HighLimitMask(self):
+        return self.reading('HighLimitMask')
+
+    def read_LowLimitMask(self):
+        return self.reading('LowLimitMask')
+
+    def apply_filters(self, names):
+        """Pass new samples of channels through their filters"""
+        if 'analog_input_values' not in names:
+            return
+        for channel in range(0, 8):
+            chain = self.filters[channel]
+            if chain is not None:
+                value = chain.update(float(
+                    self.lut(channel)[self.state.analog_input_values[channel]]))
+                if value is not None:
+                    self.filtered[channel] = value
+
+    def read_filtered(self, attr):
+        channel = int(attr.get_name().rsplit('_', 1)[1])
+        attr.set_value_date_quality(*self.reading('FilteredInput', channel))
+
+    def convert_values(self):
+        """Convert raw register values of all channels in one pass"""
+        state = self.state
+        channels = range(0, 8)
+        statuses = state.analog_input_statuses
+        values = {
+            'AnalogInput': [float(self.lut(i)[state.analog_input_values[i]])
+                            for i in channels],
+            'HistMax': [float(self.lut(i)[state.hist_max[i]])
+                        for i in channels],
+            'HistMin': [float(self.lut(i)[state.hist_min[i]])
+                        for i in channels],
+            'TypeCode': [self.decode_type_code(i) for i in channels],
+            'Status': [self.status_table_1.describe(statuses[2 * i])
+                       for i in channels],
+            'StatusMasks': decode_longs(statuses),
+            'StatusFlags': [self.status_table_1.flags(statuses[2 * i])
+                            for i in channels],
+            'OpenCircuitFlags': state.bits('open_circuit_flags'),
+            'HighAlarmFlags': state.bits('high_alarm_flag'),
+            'LowAlarmFlags': state.bits('low_alarm_flag'),
+            'HighLimitMask': self.alarms.high_mask,
+            'LowLimitMask': self.alarms.low_mask,
+            'FilteredInput': list(self.filtered),
+            'ChannelAlarm': [bool(statuses[2 * i] or statuses[2 * i + 1] or
+                                  state.open_circuit_flags[i] or
+                                  state.low_alarm_flag[i] or
+                                  state.high_alarm_flag[i])
+                             for i in channels],
+        }
+        values.update(self.derived.evaluate(values))
+        return values
 
     # --------------------
     # Additional methods
     # --------------------
 
+    def lut(self, channel):
+        """Return lookup table of calibrated values of channel indexed by
+        raw register value, rebuilt when Type Code of channel changed"""
+        type_code = self.state.analog_output_types[channel]
+        if self.lut_codes[channel] != type_code:
+            self.luts[channel] = build_lut(
+                self.encode_value(RAW_VALUES, channel),
+                self.calibrations[channel])
+            self.lut_codes[channel] = type_code
+        return self.luts[channel]
+
+    def convert(self, channel, values):
+        """Convert raw values (e.g. array of buffered values) of channel"""
+        return self.lut(channel)[values]
+
     def encode_value(self, value, channel):
-        """Encode 16-bit value to double depending on Type Code of
-        channel """
-        type_code = self.analog_output_types[channel]
+        """Encode 16-bit value (or array of values) to double depending on
+        Type Code of channel, without calibration"""
+        type_code = self.state.analog_output_types[channel]
         if   type_code == int("0182", 16): tmp = 0.02  * value/65535.0
         elif type_code == int("0180", 16): tmp = (0.016 * value/65535.0) + 0.004
         elif type_code == int("0148", 16): tmp = 10    * value/65535.0
@@ -626,12 +857,13 @@ For each AI there are associated attributes:
         elif type_code == int("0104", 16): tmp =         value/65535.0  - 0.5
         elif type_code == int("0103", 16): tmp = (0.3  * value/65535.0) - 0.15
         elif type_code == int("0181", 16): tmp = (0.04 * value/65535.0) - 0.02
-        else: tmp = self.analog_output_values[channel]
+        else: tmp = value
         return tmp
 
     def decode_type_code(self, channel):
         """Decode 16-bit number to Type Code string"""
-        return self.code_to_type_dict[self.analog_output_types[channel]]
+        return self.code_to_type_dict.get(
+            self.state.analog_output_types[channel], 'Unknown')
 
     def encode_type_code(self, value="0-20mA"):
         """Encodes Type Code string to 16-bit number"""
@@ -641,30 +873,6 @@ For each AI there are associated attributes:
     # Commands
     # --------
 
-    @command
-    @DebugIt()
-    def ConnectWithDevice(self):
-        """
-         Connect with ADAM Module with IP address the same as DeviceAddress
-         property and sets its state to ON
-        """
-        try:
-            self.connected_ADAM = ModbusTcpClient(self.DeviceAddress,
-                                                  port=int(502))
-        except ModbusException as e:
-            self.set_state(DevState.FAULT)
-            self.set_status("Modbus exception caught while"
-                            " connecting to device: \n%s" % e)
-        except Exception as e:
-            self.set_state(DevState.FAULT)
-            self.set_status("Exception caught while connecting to device:"
-                            + "\n%s" % e)
-        self.set_state(DevState.ON)
-        self.set_status("Connected do device with IP: "
-                        + str(self.DeviceAddress))
-        self.info_stream("Connected to device with IP: " + str(
-             self.DeviceAddress))
-
     @command(dtype_in=int, doc_in='Channel number')
     @DebugIt()
     def ResetHistMax(self, value):
@@ -677,36 +885,39 @@ For each AI there are associated attributes:
         """Resets Historical Minimum Value"""
         self.connected_ADAM.write_coil(110 + value, int('0xff00', 16))
 
-    @command(polling_period=500)
-    def read_DataFromDevice(self):
-        """
-          Synchronous reading data from ADAM Module registers
-         """
-        if self.get_state() == tango.DevState.ON:
-            # read Open-Circuit Flag
-            tmp = self.connected_ADAM.read_coils(120, 8)
-            self.open_circuit_flags = tmp.bits
-            # read LowAlarmFlags
-            tmp = self.connected_ADAM.read_coils(130, 8)
-            self.low_alarm_flag = tmp.bits
-            # read High Alarm Flags
-            tmp = self.connected_ADAM.read_coils(140, 8)
-            self.high_alarm_flag = tmp.bits
-            # read Analog Inputs
-            tmp = self.connected_ADAM.read_holding_registers(0, 8)
-            self.analog_input_values = tmp.registers
-            # read Historical Max Values
-            tmp = self.connected_ADAM.read_holding_registers(10, 8)
-            self.hist_max = tmp.registers
-            # read Historical Min Value
-            tmp = self.connected_ADAM.read_holding_registers(20, 8)
-            self.hist_min = tmp.registers
-            # read Statuses
-            tmp = self.connected_ADAM.read_holding_registers(100, 16)
-            self.analog_input_statuses = tmp.registers
-            # read Type Codes
-            tmp = self.connected_ADAM.read_holding_registers(200, 8)
-            self.analog_output_types = tmp.registers
+    @command(dtype_in=int, doc_in='Channel mask (bit 0 - channel 0)')
+    @DebugIt()
+    def ResetHistMaxChannels(self, value):
+        """Resets Historical Maximum Values of channels in mask at once"""
+        self.reset_historical(100, 'hist_max', value)
+
+    @command(dtype_in=int, doc_in='Channel mask (bit 0 - channel 0)')
+    @DebugIt()
+    def ResetHistMinChannels(self, value):
+        """Resets Historical Minimum Values of channels in mask at once"""
+        self.reset_historical(110, 'hist_min', value)
+
+    @command
+    @DebugIt()
+    def ResetHistMaxAll(self):
+        """Resets Historical Maximum Values of all channels at once"""
+        self.reset_historical(100, 'hist_max', 0xff)
+
+    @command
+    @DebugIt()
+    def ResetHistMinAll(self):
+        """Resets Historical Minimum Values of all channels at once"""
+        self.reset_historical(110, 'hist_min', 0xff)
+
+    def reset_historical(self, coil, name, mask):
+        """Write reset coils of channels in mask in one write_coils and
+        read the historical values back"""
+        span = mask_span(mask, 8)
+        if span is None:
+            raise ValueError
+        first, coils = span
+        self.connected_ADAM.write_coils(coil + first, coils)
+        self.acquisition.fetch([name])
 
 # ----------
 # Run server
@@ -714,6 +925,7 @@ For each AI there are associated attributes:
 
 def main(args=None, **kwargs):
     from tango.server import run
+    kwargs.setdefault('post_init_callback', registry.auto_connect)
     return run((ADAM6217,), args=args, **kwargs)
 
 if __name__ == '__main__':
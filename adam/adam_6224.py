@@ -22,11 +22,17 @@ from tango import AttrQuality, AttrWriteType, DispLevel, DevState
 from functools import partial
 
 # Additional import
-from pymodbus.client.sync import ModbusTcpClient
-from pymodbus.exceptions import ModbusException
+import time
+from adam import ADAMDevice
+from io_worker import IOWorker
+from registers import StatusTable, index_runs
+from state import state_class
+from registry import registry
+from scheduler import scheduler
+from ramps import RampEngine
 
 
-class ADAM6224(Device):
+class ADAM6224(ADAMDevice):
     """ ADAM6224
 It is a definition of a class used to control ADAM-6224 controller via
 Modbus TCP.
@@ -45,6 +51,14 @@ For each AO there are associated attributes:
     AO triggered to Fail Safety Value
  * CodeType(string) - contains present type of output of the channel,
     available:  0-20mA, 4-20mA, 0-10V, 0-5V, +-10V, +-5V
+ * RampTarget(double) - target of the output value, written value is
+    approached at the rate given by RampRates property
+
+Ramping(bool per channel) attribute shows channels being ramped, AbortRamp
+and AbortAllRamps commands stop ramps at the present output value.
+
+Statuses of all channels are also available as StatusMasks (int bit masks)
+and StatusFlags (bool per flag) attributes.
 
 For each DI there are associated attributes:
 
@@ -55,33 +69,75 @@ For each DI there are associated attributes:
 
 """
     __metaclass__ = DeviceMeta
-    connected_ADAM = 0.0
-    digital_input_values = [False, False, False, False]
-    digital_input_events = [0, 0, 0, 0]
-    analog_output_values = [0, 0, 0, 0]
-    analog_output_statuses = [0, 0, 0, 0, 0, 0, 0, 0]
-    analog_output_types = [0, 0, 0, 0]
-    analog_output_startup_values = [0, 0, 0, 0]
-    analog_output_safety_values = [0, 0, 0, 0]
+    model = 'ADAM-6224'
     type_to_code_dict = {'0-20mA': int("0182", 16), '4-20mA': int("0180", 16),
                          '0-10V': int("0148", 16), '0-5V': int("0147", 16),
                          '+-10V': int("0143", 16), '+-5V': int("0142", 16)}
     code_to_type_dict = {v: k for k, v in type_to_code_dict.iteritems()}
+    # output ranges (low, high) of Type Codes, spanned by 12-bit values
+    type_ranges = {int("0182", 16): (0.0, 0.02),
+                   int("0180", 16): (0.004, 0.02),
+                   int("0148", 16): (0.0, 10.0),
+                   int("0147", 16): (0.0, 5.0),
+                   int("0143", 16): (-10.0, 10.0),
+                   int("0142", 16): (-5.0, 5.0)}
 
     event_status_dictionary = {int(1): 'Unreliable DI value (UART Timeout)',
                                int(2): 'Safety Value triggered',
                                int(4): 'Startup Value triggered',
                                int(0): ' '}
+    event_status_table = StatusTable(event_status_dictionary)
 
     status_dict_1 = {int(1): 'Fail to provide AO Value',
                      int(8): 'No Output Current',
                      int(512): 'Zero/Span Calibration Error',
                      int(0): ' '}
+    status_table_1 = StatusTable(status_dict_1)
 
     status_dict_2 = {int(1): 'DI triggered to Safety Value',
                      int(2): 'DI triggered to Startup Value',
                      int(4): 'AO triggered to Fail Safety Value',
                      int(0): ' '}
+    status_table_2 = StatusTable(status_dict_2)
+
+    # register groups (name, kind, address, count) read from device
+    register_groups = (
+        ('digital_input_values', 'coils', 0, 4),
+        ('analog_output_values', 'registers', 0, 4),
+        ('analog_output_statuses', 'registers', 100, 8),
+        ('digital_input_events', 'registers', 110, 4),
+        ('analog_output_types', 'registers', 200, 4),
+        ('analog_output_startup_values', 'registers', 400, 4),
+        ('analog_output_safety_values', 'registers', 410, 4),
+    )
+    # raw values of register groups, one instance per device
+    state_type = state_class('ADAM6224State', register_groups)
+    # attributes with ALARM quality when their channel reports a problem
+    alarm_attributes = ('AnalogOutput',)
+    # register groups needed by attributes
+    attribute_groups = {
+        'DigitalInput': ('digital_input_values',),
+        'EventStatus': ('digital_input_events',),
+        'AnalogOutput': ('analog_output_values', 'analog_output_types',
+                         'analog_output_statuses'),
+        'SafetyValue': ('analog_output_safety_values', 'analog_output_types'),
+        'StartupValue': ('analog_output_startup_values',
+                         'analog_output_types'),
+        'TypeCode': ('analog_output_types',),
+        'Status': ('analog_output_statuses',),
+        'StatusMasks': ('analog_output_statuses',),
+        'StatusFlags': ('analog_output_statuses',),
+    }
+
+    # register groups holding configuration, read at connection, every
+    # ConfigRefreshPeriod and after writes instead of in polling cycles
+    config_groups = ('analog_output_types',)
+
+    # configuration blocks (address, count) handled by Save/Restore commands
+    config_registers = ((200, 4), (400, 4), (410, 4))
+    config_coils = ()
+    restored_groups = ('analog_output_types', 'analog_output_startup_values',
+                       'analog_output_safety_values')
 
     # ----------------
     # Class Properties
@@ -94,7 +150,30 @@ For each DI there are associated attributes:
     DeviceAddress = device_property(
         dtype='str',
         default_value="192.168.120.55",
-        doc="An IP address of device"
+        doc="An IP address of device, optionally followed by Modbus TCP "
+            "port and unit ID (e.g. 192.168.120.10:502/3) to share one "
+            "connection of a gateway with other devices"
+    )
+
+    WriteDeadband = device_property(
+        dtype='int',
+        default_value=0,
+        doc="Writes of AnalogOutput differing from the present output by at "
+            "most this number of counts are skipped"
+    )
+
+    RampRates = device_property(
+        dtype=(float,),
+        default_value=[],
+        doc="Rates (in V/s or A/s, units of AnalogOutput) at which "
+            "RampTarget is approached, one value for all channels or one per "
+            "channel, 0 writes the target at once"
+    )
+
+    RampPeriod = device_property(
+        dtype='double',
+        default_value=100.0,
+        doc="Period (in milliseconds) of output updates of ramping channels"
     )
 
     # ------------------
@@ -106,73 +185,104 @@ For each DI there are associated attributes:
     # --------------------
 
     def read_DigitalInput(self, channel):
-        return self.digital_input_values[channel]
+        return self.reading('DigitalInput', channel)
 
     # --------------------
     # EventStatus method
     # --------------------
 
     def read_EventStatus(self, channel):
-        return self.event_status_dictionary[self.digital_input_events[channel]]
+        return self.reading('EventStatus', channel)
 
     # --------------------
     # Status method
     # --------------------
 
     def read_Status(self, channel):
-        reg = 2 * channel
-        return self.status_dict_1[self.analog_output_statuses[reg]] + \
-               ' ' + \
-               self.status_dict_2[self.analog_output_statuses[reg + 1]]
+        return self.reading('Status', channel)
+
+    def read_StatusMasks(self):
+        return self.reading('StatusMasks')
+
+    def read_StatusFlags(self):
+        return self.reading('StatusFlags')
 
     # --------------------
     # AnalogOutput method
     # --------------------
 
     def read_AnalogOutput(self, channel):
-        return self.encode_value(self.analog_output_values[channel], channel)
+        return self.reading('AnalogOutput', channel)
 
     def write_AnalogOutput(self, channel, value):
-        self.connected_ADAM.write_register(channel, self.decode_value(value,
-                                                                      channel,
-                                                                      0))
+        raw = self.decode_value(value, channel, 0)
+        self.ramps.abort(channel)
+        if self.write_suppressed('analog_output_values', channel, raw):
+            return
+        self.write_group('analog_output_values', channel, [raw])
+
+    # --------------------
+    # RampTarget method
+    # --------------------
+
+    def read_RampTarget(self, channel):
+        target = self.ramps.target(channel)
+        if target is None:
+            return self.reading('AnalogOutput', channel)
+        return target, time.time(), AttrQuality.ATTR_CHANGING
+
+    def write_RampTarget(self, channel, value):
+        self.decode_value(value, channel, 0)
+        if not self.ramps.rates[channel]:
+            self.write_AnalogOutput(channel, value)
+            return
+        if not self.state.timestamp('analog_output_values'):
+            self.acquisition.fetch(['analog_output_values'])
+        position = self.get_converted()['AnalogOutput'][channel]
+        with self.ramps.lock:
+            self.ramps.start(channel, position, value)
+            scheduler.add((self.get_name(), 'ramp'), self.ramp_slot,
+                          self.RampPeriod / 1000.0)
+
+    def read_Ramping(self):
+        return [self.ramps.target(i) is not None for i in range(0, 4)]
 
     # --------------------
     # SafetyValue method
     # --------------------
 
     def read_SafetyValue(self, channel):
-        return self.encode_value(self.analog_output_safety_values[channel],
-                                 channel)
+        return self.reading('SafetyValue', channel)
 
-    def write_SafetyValue(self, value, channel):
-        reg = 410 + channel
-        self.connected_ADAM.write_register(reg, self.decode_value(value,
-                                                                  channel, 1))
+    def write_SafetyValue(self, channel, value):
+        self.write_group('analog_output_safety_values', 410 + channel,
+                         [self.decode_value(value, channel, 1)])
 
     # --------------------
     # StartupValue method
     # --------------------
 
     def read_StartupValue(self, channel):
-        return self.encode_value(self.analog_output_startup_values[channel],
-                                 channel)
+        return self.reading('StartupValue', channel)
 
-    def write_StartupValue(self, value, channel):
-        reg = 400 + channel
-        self.connected_ADAM.write_register(reg, self.decode_value(value,
-                                                                  channel, 2))
+    def write_StartupValue(self, channel, value):
+        self.write_group('analog_output_startup_values', 400 + channel,
+                         [self.decode_value(value, channel, 2)])
 
     # --------------------
     # TypeCode method
     # --------------------
 
     def read_TypeCode(self, channel):
-        return self.decode_type_code(channel)
+        return self.reading('TypeCode', channel)
 
-    def write_TypeCode(self, value, channel):
-        reg = 200 + channel
-        self.connected_ADAM.write_register(reg, self.encode_type_code(value))
+    def write_TypeCode(self, channel, value):
+        """Write Type Code of channel and read Type Codes back, so
+        conversions use the new one at once"""
+        self.write_group('analog_output_types', 200 + channel,
+                         [self.encode_type_code(value)])
+        if not self.VerifyWrites:
+            self.acquisition.fetch(['analog_output_types'])
 
     # ----------
     # Attributes
@@ -358,31 +468,85 @@ For each DI there are associated attributes:
         doc="Event Status of channel 3 of Digital Input"
     )
 
+    StatusMasks = attribute(
+        dtype=(int,),
+        access=AttrWriteType.READ,
+        max_dim_x=4,
+        doc="Status bit masks of Analog Output channels (first status "
+            "register in low word, second in high word)"
+    )
+
+    StatusFlags = attribute(
+        dtype=((bool,),),
+        access=AttrWriteType.READ,
+        max_dim_x=6,
+        max_dim_y=4,
+        doc="Status flags of Analog Output channels (row - channel, column - "
+            "flag in order of Status description)"
+    )
+
+    SuppressedWrites = attribute(
+        dtype='int',
+        access=AttrWriteType.READ,
+        doc="Number of output writes skipped since start, because the "
+            "output already had the written value"
+    )
+
+    RampTarget_0 = attribute(
+        dtype=float,
+        access=AttrWriteType.READ_WRITE,
+        format='%2.4f',
+        doc="Target of the output value of channel 0, approached at its "
+            "ramp rate"
+    )
+
+    RampTarget_1 = attribute(
+        dtype=float,
+        access=AttrWriteType.READ_WRITE,
+        format='%2.4f',
+        doc="Target of the output value of channel 1, approached at its "
+            "ramp rate"
+    )
+
+    RampTarget_2 = attribute(
+        dtype=float,
+        access=AttrWriteType.READ_WRITE,
+        format='%2.4f',
+        doc="Target of the output value of channel 2, approached at its "
+            "ramp rate"
+    )
+
+    RampTarget_3 = attribute(
+        dtype=float,
+        access=AttrWriteType.READ_WRITE,
+        format='%2.4f',
+        doc="Target of the output value of channel 3, approached at its "
+            "ramp rate"
+    )
+
+    Ramping = attribute(
+        dtype=(bool,),
+        max_dim_x=4,
+        access=AttrWriteType.READ,
+        doc="Channels whose outputs are being ramped to their targets"
+    )
+
     # ---------------
     # General methods
     # ---------------
 
-    def init_device(self):
-        """Initialise device and sets its state to STANDBY"""
-        Device.init_device(self)
-        self.set_state(DevState.STANDBY)
-        self.set_status("ADAM-6224 in state STANDBY, ready to connect to "
-                        "device")
-
-    def delete_device(self):
-        """Disconnect from physical device before deleting instance"""
-        self.connected_ADAM.close()
+    def init_channels(self):
+        self.range_codes = [None] * 4
+        self.ranges = [None] * 4
+        self.suppressed_writes = 0
+        self.ramps = RampEngine(self.RampRates, 4)
+        # number of ramp writes still running
+        self.ramp_busy = 0
 
-
-    @command
-    @DebugIt()
-    def disconnect(self):
-        """Disconnect from device and sets state to STANDBY """
-        self.connected_ADAM.close()
-        self.set_state(DevState.STANDBY)
-        self.set_status(
-            "Device disconnected form ADAM-6224, set state to STANDBY, "
-            "ready to connect to device again")
+    def stop_jobs(self):
+        """Remove jobs of device, including ramps, from poll scheduler"""
+        self.AbortAllRamps()
+        ADAMDevice.stop_jobs(self)
 
     # --------------------
     # AnalogOutput methods
@@ -436,6 +600,34 @@ For each DI there are associated attributes:
     def write_AnalogOutput_7(self, value):
         return self.write_AnalogOutput(7, value)
 
+    # ------------------
+    # RampTarget methods
+    # ------------------
+
+    def read_RampTarget_0(self):
+        return self.read_RampTarget(0)
+
+    def write_RampTarget_0(self, value):
+        return self.write_RampTarget(0, value)
+
+    def read_RampTarget_1(self):
+        return self.read_RampTarget(1)
+
+    def write_RampTarget_1(self, value):
+        return self.write_RampTarget(1, value)
+
+    def read_RampTarget_2(self):
+        return self.read_RampTarget(2)
+
+    def write_RampTarget_2(self, value):
+        return self.write_RampTarget(2, value)
+
+    def read_RampTarget_3(self):
+        return self.read_RampTarget(3)
+
+    def write_RampTarget_3(self, value):
+        return self.write_RampTarget(3, value)
+
     # --------------------
     # SafetyValue methods
     # --------------------
@@ -640,79 +832,147 @@ For each DI there are associated attributes:
     def read_Status_3(self):
         return self.read_Status(3)
 
+    def ramp_slot(self):
+        """Move ramping channels toward their targets by the time elapsed
+        since their previous step and write output registers of each run of
+        adjacent ramping channels in one request, so outputs of other
+        channels are not rewritten, return False if previous writes are
+        still running"""
+        if self.ramp_busy:
+            return False
+        with self.ramps.lock:
+            positions = self.ramps.step()
+            if not self.ramps.targets:
+                scheduler.remove((self.get_name(), 'ramp'))
+        if not positions:
+            return True
+        try:
+            values = dict((channel, self.decode_value(position, channel, 0))
+                          for channel, position in positions.items())
+        except ValueError:
+            self.AbortAllRamps()
+            raise
+        worker = self.connected_ADAM
+        runs = index_runs(values)
+        self.ramp_busy = len(runs)
+        for first, stop in runs:
+            run = [values[channel] for channel in range(first, stop)]
+            worker.submit(IOWorker.WRITE, worker.execute, 'write_registers',
+                          first, run,
+                          callback=partial(self.ramp_written, worker, first,
+                                           run))
+        return True
+
+    def ramp_written(self, worker, first, values, request):
+        """Hand finished ramp write to the delivery thread of worker"""
+        worker.deliver(self.finish_ramp, request, first, values,
+                       callback=self.ramp_done)
+
+    def finish_ramp(self, request, first, values):
+        """Store values of ramp write once the module accepted them, stop
+        all ramps if it failed"""
+        with self.monitor():
+            if request.error is not None:
+                self.error_stream('Ramp write failed: %s' % request.error)
+                self.AbortAllRamps()
+                return
+            self.state.write('analog_output_values', first, values,
+                             request.time)
+
+    def ramp_done(self, request):
+        self.ramp_busy -= 1
+
+    def write_suppressed(self, name, channel, value):
+        """Return True, counting the skipped write, if register of channel
+        in recently read group already holds value (within WriteDeadband
+        counts)"""
+        timestamp = self.state.timestamp(name)
+        if timestamp and time.time() - timestamp <= self.stale_age and \
+                abs(getattr(self.state, name)[channel] - value) <= \
+                self.WriteDeadband:
+            self.suppressed_writes += 1
+            return True
+        return False
+
+    def read_SuppressedWrites(self):
+        return self.suppressed_writes
+
+    def convert_values(self):
+        """Convert raw register values of all channels in one pass"""
+        state = self.state
+        channels = range(0, 4)
+        statuses = state.analog_output_statuses
+        values = {
+            'AnalogOutput': [
+                self.encode_value(state.analog_output_values[i], i)
+                for i in channels],
+            'SafetyValue': [
+                self.encode_value(state.analog_output_safety_values[i], i)
+                for i in channels],
+            'StartupValue': [
+                self.encode_value(state.analog_output_startup_values[i], i)
+                for i in channels],
+            'TypeCode': [self.decode_type_code(i) for i in channels],
+            'EventStatus': [
+                self.event_status_table.describe(state.digital_input_events[i])
+                for i in channels],
+            'Status': [self.status_table_1.describe(statuses[2 * i]) + ' ' +
+                       self.status_table_2.describe(statuses[2 * i + 1])
+                       for i in channels],
+            'StatusMasks': [statuses[2 * i] | statuses[2 * i + 1] << 16
+                            for i in channels],
+            'StatusFlags': [self.status_table_1.flags(statuses[2 * i]) +
+                            self.status_table_2.flags(statuses[2 * i + 1])
+                            for i in channels],
+            'DigitalInput': state.bits('digital_input_values'),
+            'ChannelAlarm': [bool(statuses[2 * i] or statuses[2 * i + 1])
+                             for i in channels],
+        }
+        values.update(self.derived.evaluate(values))
+        return values
+
     # --------------------
     # Additional methods
     # --------------------
 
+    def output_range(self, channel):
+        """Return (low, high) output range of channel, None for unknown Type
+        Code, looked up again only when Type Code of channel changed"""
+        type_code = self.state.analog_output_types[channel]
+        if self.range_codes[channel] != type_code:
+            self.ranges[channel] = self.type_ranges.get(type_code)
+            self.range_codes[channel] = type_code
+        return self.ranges[channel]
+
     def decode_value(self, value, channel, type):
         """Decode double to 16-bit value depending on Type Code of
         channel """
-        type_code = self.analog_output_types[channel]
-        if ((type_code == int("0182", 16) and not
-        (value >= 0 and value <= 0.02)) or
-                (type_code == int("0180", 16) and not
-                (value >= 0.004 and value <= 0.02)) or
-                (type_code == int("0148", 16) and not
-                (value >= 0 and value <= 10)) or
-                (type_code == int("0147", 16) and not
-                (value >= 0 and value <= 5)) or
-                (type_code == int("0143", 16) and not
-                (value >= -10 and value <= 10)) or
-                (type_code == int("0142", 16) and not
-                (value >= -5 and value <= 5))):
+        output_range = self.output_range(channel)
+        if output_range is None:
             if type == 0:
-                tmp = self.analog_output_values[channel]
+                return self.state.analog_output_values[channel]
             elif type == 1:
-                tmp = self.analog_output_safety_values[channel]
-            else:
-                tmp = self.analog_output_statup_values[channel]
+                return self.state.analog_output_safety_values[channel]
+            return self.state.analog_output_startup_values[channel]
+        low, high = output_range
+        if not low <= value <= high:
             self.error_stream('Illegal value')
             raise ValueError
-        else:
-            if type_code == int("0182", 16):
-                tmp = int(4095 * value / 0.02)
-            elif type_code == int("0180", 16):
-                tmp = int(4095 * (value - 0.004) / 0.016)
-            elif type_code == int("0148", 16):
-                tmp = int(4095 * value / 10)
-            elif type_code == int("0147", 16):
-                tmp = int(4095 * value / 5)
-            elif type_code == int("0143", 16):
-                tmp = int(4095 * (value + 10) / 20)
-            elif type_code == int("0142", 16):
-                tmp = int(4095 * (value + 5) / 10)
-            else:
-                if type == 0:
-                    tmp = self.analog_output_values[channel]
-                elif type == 1:
-                    tmp = self.analog_output_safety_values[channel]
-                else:
-                    tmp = self.analog_output_statup_values[channel]
-        return tmp
+        return int(4095 * (value - low) / (high - low))
 
     def encode_value(self, value, channel):
         """Encode 16-bit value to double depending on Type Code of
         channel """
-        type_code = self.analog_output_types[channel]
-        if type_code == int("0182", 16):
-            tmp = 0.02 * value / 4095.0
-        elif type_code == int("0180", 16):
-            tmp = (0.016 * value / 4095.0) + 0.004
-        elif type_code == int("0148", 16):
-            tmp = 10 * value / 4095.0
-        elif type_code == int("0147", 16):
-            tmp = 5 * value / 4095.0
-        elif type_code == int("0143", 16):
-            tmp = (20 * value / 4095.0) - 10
-        elif type_code == int("0142", 16):
-            tmp = (10 * value / 4095.0) - 5
-        else:
-            tmp = self.analog_output_values[channel]
-        return tmp
+        output_range = self.output_range(channel)
+        if output_range is None:
+            return value
+        low, high = output_range
+        return (high - low) * value / 4095.0 + low
 
     def decode_type_code(self, channel):
         """Decode 16-bit number to Type Code string"""
-        return self.code_to_type_dict[self.analog_output_types[channel]]
+        return self.code_to_type_dict.get(
+            self.state.analog_output_types[channel], 'Unknown')
 
     def encode_type_code(self, value="0-20mA"):
         """Encodes Type Code string to 16-bit number"""
@@ -722,56 +982,23 @@ For each DI there are associated attributes:
     # Commands
     # --------
 
-    @command
+    @command(dtype_in=int, doc_in='Channel')
     @DebugIt()
-    def ConnectWithDevice(self):
+    def AbortRamp(self, channel):
         """
-         Connect with ADAM Module with IP address the same as DeviceAddress
-         property and sets its state to ON
-        """
-        try:
-            self.connected_ADAM = ModbusTcpClient(self.DeviceAddress,
-                                                  port=int(502))
-        except ModbusException as e:
-            self.set_state(DevState.FAULT)
-            self.set_status("Modbus exception caught while"
-                            " connecting to device: \n%s" % e)
-        except Exception as e:
-            self.set_state(DevState.FAULT)
-            self.set_status("Exception caught while connecting to device:"
-                            + "\n%s" % e)
-        self.set_state(DevState.ON)
-        self.set_status("Connected to device with IP: "
-                        + str(self.DeviceAddress))
-
-    @command(polling_period=500)
-    def read_DataFromDevice(self):
+         Stop ramp of channel at its present output value
         """
-          Synchronous reading data from ADAM Module registers
-         """
-        if self.get_state() == tango.DevState.ON:
-            # read Digital Inputs
-            tmp = self.connected_ADAM.read_coils(0, 4)
-            self.digital_input_values = tmp.bits
-            # read Analog Outputs Value
-            tmp = self.connected_ADAM.read_holding_registers(0, 4)
-            self.analog_output_values = tmp.registers
-            # read Analog Outputs Status
-            tmp = self.connected_ADAM.read_holding_registers(100, 8)
-            self.analog_output_statuses = tmp.registers
-            # read Digital Inputs Status
-            tmp = self.connected_ADAM.read_holding_registers(110, 4)
-            self.digital_input_events = tmp.registers
-            # read Type Codes
-            tmp = self.connected_ADAM.read_holding_registers(200, 4)
-            self.analog_output_types = tmp.registers
-            # read Startup Values
-            tmp = self.connected_ADAM.read_holding_registers(400, 4)
-            self.analog_output_startup_values = tmp.registers
-            # read Safety Values
-            tmp = self.connected_ADAM.read_holding_registers(410, 4)
-            self.analog_output_safety_values = tmp.registers
+        self.ramps.abort(channel)
 
+    @command
+    @DebugIt()
+    def AbortAllRamps(self):
+        """
+         Stop ramps of all channels at their present output values
+        """
+        with self.ramps.lock:
+            self.ramps.abort()
+            scheduler.remove((self.get_name(), 'ramp'))
 
 # ----------
 # Run server
@@ -780,6 +1007,7 @@ For each DI there are associated attributes:
 
 def main(args=None, **kwargs):
     from tango.server import run
+    kwargs.setdefault('post_init_callback', registry.auto_connect)
     return run((ADAM6224,), args=args, **kwargs)
 
 
@@ -21,10 +21,15 @@ from tango import AttrQuality, AttrWriteType, DispLevel, DevState
 from functools import partial
 
 # Additional import
-from pymodbus.client.sync import ModbusTcpClient
+import time
 from pymodbus.exceptions import ModbusException
+from adam import ADAMDevice
+from registers import encode_longs, decode_longs, changed_span, mask_span, \
+    index_runs
+from state import state_class
+from registry import registry
 
-class ADAM6250(Device):
+class ADAM6250(ADAMDevice):
     """ ADAM6250
 It is a definition of a class used to control ADAM-6250 controller via
 Modbus TCP.
@@ -57,21 +62,43 @@ For each DO there are associated attributes:
 
 """
     __metaclass__ = DeviceMeta
-    connected_ADAM = 0.0
-    digital_input_values = [False, False, False, False, False, False,
-                            False, False]
-    counter = [False, False, False, False, False, False, False, False]
-    clear_overflow = [False, False, False, False, False, False, False,
-                      False]
-    latch_status = [False, False, False, False, False, False, False,
-                    False]
-    digital_output_values = [False, False, False, False, False, False,
-                             False]
-    counter_frequency = [0, 0, 0, 0, 0, 0, 0]
-    pulse_output_low = [0, 0, 0, 0, 0, 0, 0]
-    pulse_output_high = [0, 0, 0, 0, 0, 0, 0]
-    absolute_pulse_output = [0, 0, 0, 0, 0, 0, 0]
-    incremental_pulse_output = [0, 0, 0, 0, 0, 0, 0]
+    model = 'ADAM-6250'
+
+    # register groups (name, kind, address, count) read from device
+    register_groups = (
+        ('digital_input_values', 'coils', 0, 8),
+        # Counter, Clear Overflow and Latch Status flags
+        ('counter_flags', 'coils', 32, 32),
+        ('digital_output_values', 'coils', 16, 7),
+        # Counter/Frequency and Pulse Outputs
+        ('holding_registers', 'registers', 0, 72),
+    )
+    # per-instance store of raw values of register groups
+    state_type = state_class('ADAM6250State', register_groups)
+    # attributes with ALARM quality when their channel reports a problem
+    alarm_attributes = ()
+    # register groups needed by attributes
+    attribute_groups = {
+        'DigitalInput': ('digital_input_values',),
+        'DigitalOutput': ('digital_output_values',),
+        'Counter': ('counter_flags',),
+        'Overflow': ('counter_flags',),
+        'LatchStatus': ('counter_flags',),
+        'CounterFrequency': ('holding_registers',),
+        'PulseOutputLow': ('holding_registers',),
+        'PulseOutputHigh': ('holding_registers',),
+        'AbsolutePulse': ('holding_registers',),
+        'IncrementalPulse': ('holding_registers',),
+    }
+
+    # configuration blocks (address, count) handled by Save/Restore commands,
+    # pulse widths only: writing AbsolutePulse/IncrementalPulse (44-71)
+    # starts pulse trains
+    config_registers = ((16, 28),)
+    config_coils = ((32, 8), (48, 8), (56, 8))
+    restored_groups = ('counter_flags', 'holding_registers')
+    # AbsolutePulse/IncrementalPulse count down while pulses are output
+    unverified_registers = ((44, 28),)
 
     # ----------------
     # Class Properties
@@ -84,7 +111,9 @@ For each DO there are associated attributes:
     DeviceAddress = device_property(
         dtype='str',
         default_value="192.168.120.57",
-        doc="An IP address of device"
+        doc="An IP address of device, optionally followed by Modbus TCP "
+            "port and unit ID (e.g. 192.168.120.10:502/3) to share one "
+            "connection of a gateway with other devices"
     )
 
     # --------------------
@@ -94,8 +123,8 @@ For each DO there are associated attributes:
     def encode(self,value):
         """Prepare list of ints to write to registers responsible for counters'
                 statues"""
-        tmp = [0, 0, 0, 0, 0, 0, 0, 0]
-        for i in range(0,8):
+        tmp = [0] * len(value)
+        for i in range(0, len(value)):
             if value[i] == True:
                 tmp[i] = int('0xff00', 16)
         return tmp
@@ -103,69 +132,141 @@ For each DO there are associated attributes:
     def encode_values(self,value):
         """Prepare list of ints to write to registers responsible for Pulses'
         values"""
-        tmp = range(0,14) * 0
-        for i in range(0,7):
-            tmp[2 * i] = int(value[i] / 65536)
-            tmp[2 * i + 1] = int(value[i] % 65536)
-        return tmp
+        return encode_longs(value[0:7])
+
+    def get_pulse_widths(self):
+        """Return raw words of Pulse Output Low/High widths (registers
+        16-43), reading them from device if they were not read yet"""
+        if not self.state.timestamp('holding_registers'):
+            self.acquisition.fetch(['holding_registers'])
+        return list(self.state.holding_registers[16:44])
+
+    def write_pulse_widths(self, words):
+        """Write Pulse Output widths in one transaction, covering only the
+        span of words which differ from cached state"""
+        span = changed_span(self.get_pulse_widths(), words)
+        if span is None:
+            return
+        start, stop = span
+        self.write_group('holding_registers', 16 + start, words[start:stop])
+
+    def write_pulse_triggers(self, words):
+        """Write Absolute/Incremental Pulse words (dict of offset from
+        register 44 to word), each run of consecutive words in one
+        transaction. They are never compared with cached state: writing
+        starts pulse trains and the module counts them down."""
+        for start, stop in index_runs(words):
+            self.write_group('holding_registers', 44 + start,
+                             [words[i] for i in range(start, stop)])
+
+    def write_pulse_section(self, section, value):
+        """Write values of one Pulse Output attribute (0 - Low, 1 - High,
+        2 - Absolute, 3 - Incremental), widths only where changed"""
+        tmp = self.encode_values(value)
+        if section >= 2:
+            offset = 14 * (section - 2)
+            self.write_pulse_triggers(dict((offset + i, word)
+                                           for i, word in enumerate(tmp)))
+            return
+        words = self.get_pulse_widths()
+        offset = 14 * section
+        words[offset:offset + len(tmp)] = tmp
+        self.write_pulse_widths(words)
+
+    def write_suppressed(self, name, value):
+        """Return True, counting the skipped write, if coils of recently
+        read group already hold value"""
+        timestamp = self.state.timestamp(name)
+        if timestamp and time.time() - timestamp <= self.stale_age and \
+                self.state.bits(name, 0, len(value)) == \
+                [bool(v) for v in value]:
+            self.suppressed_writes += 1
+            return True
+        return False
+
+    def read_SuppressedWrites(self):
+        return self.suppressed_writes
+
+    def convert_values(self):
+        """Convert raw register values of all channels in one pass"""
+        state = self.state
+        registers = state.holding_registers
+        values = {
+            'DigitalInput': state.bits('digital_input_values'),
+            'DigitalOutput': state.bits('digital_output_values'),
+            'Counter': state.bits('counter_flags', 0, 8),
+            'Overflow': state.bits('counter_flags', 17, 24),
+            'LatchStatus': state.bits('counter_flags', 25, 32),
+            'CounterFrequency': decode_longs(registers[0:14]),
+            'PulseOutputLow': decode_longs(registers[16:30]),
+            'PulseOutputHigh': decode_longs(registers[30:44]),
+            'AbsolutePulse': decode_longs(registers[44:58]),
+            'IncrementalPulse': decode_longs(registers[58:72]),
+        }
+        values.update(self.derived.evaluate(values))
+        return values
 
     # ------------------
     # Attributes methods
     # ------------------
 
     def read_DigitalInput(self):
-        return self.digital_input_values
+        return self.reading('DigitalInput')
 
     def read_DigitalOutput(self):
-        return self.digital_output_values
+        return self.reading('DigitalOutput')
 
     def write_DigitalOutput(self, value):
+        if self.write_suppressed('digital_output_values', value):
+            return
         self.connected_ADAM.write_coils(16,self.encode(value))
+        self.state.write('digital_output_values', 0,
+                         [bool(v) for v in value])
 
     def read_Counter(self):
-        return self.counter
+        return self.reading('Counter')
 
     def write_Counter(self, value):
         self.connected_ADAM.write_coils(32,self.encode(value))
 
     def read_Overflow(self):
-        return self.clear_overflow
+        return self.reading('Overflow')
 
     def write_Overflow(self, value):
         self.connected_ADAM.write_coils(48,self.encode(value))
 
     def read_LatchStatus(self):
-        return self.latch_status
+        return self.reading('LatchStatus')
 
     def write_LatchStatus(self, value):
         self.connected_ADAM.write_coils(56, self.encode(value))
 
     def read_CounterFrequency(self):
-        return self.counter_frequency
+        return self.reading('CounterFrequency')
 
     def read_PulseOutputLow(self):
-        return self.pulse_output_low
+        return self.reading('PulseOutputLow')
 
     def write_PulseOutputLow(self, value):
-        self.connected_ADAM.write_registers(16, self.encode_values(value))
+        self.write_pulse_section(0, value)
 
     def read_PulseOutputHigh(self):
-        return self.pulse_output_high
+        return self.reading('PulseOutputHigh')
 
     def write_PulseOutputHigh(self, value):
-        self.connected_ADAM.write_registers(30, self.encode_values(value))
+        self.write_pulse_section(1, value)
 
     def read_AbsolutePulse(self):
-        return self.absolute_pulse_output
+        return self.reading('AbsolutePulse')
 
     def write_AbsolutePulse(self, value):
-        self.connected_ADAM.write_registers(44, self.encode_values(value))
+        self.write_pulse_section(2, value)
 
     def read_IncrementalPulse(self):
-        return self.incremental_pulse_output
+        return self.reading('IncrementalPulse')
 
     def write_IncrementalPulse(self, value):
-        self.connected_ADAM.write_registers(58, self.encode_values(value))
+        self.write_pulse_section(3, value)
 
     # ----------
     # Attributes
@@ -241,63 +342,24 @@ For each DO there are associated attributes:
         max_dim_x=7
     )
 
-
-
+    SuppressedWrites = attribute(
+        dtype='int',
+        access=AttrWriteType.READ,
+        doc="Number of output writes skipped since start, because the "
+            "output already had the written value"
+    )
 
     # ---------------
     # General methods
     # ---------------
 
-    def init_device(self):
-        """Initialise device and sets its state to STANDBY"""
-        Device.init_device(self)
-        self.set_state(DevState.STANDBY)
-        self.set_status(
-            "ADAM-6250 in state STANDBY, ready to connect to "
-            "device")
-
-    def delete_device(self):
-        """Disconnect from physical device before deleting instance"""
-        self.connected_ADAM.close()
-
-
-    @command
-    @DebugIt()
-    def disconnect(self):
-        """Disconnect from device and sets state to STANDBY """
-        self.connected_ADAM.close()
-        self.set_state(DevState.STANDBY)
-        self.set_status(
-            "Device disconnected form ADAM-6250, set state to STANDBY, "
-            "ready to connect to device again")
+    def init_channels(self):
+        self.suppressed_writes = 0
 
     # --------
     # Commands
     # --------
 
-    @command
-    @DebugIt()
-    def ConnectWithDevice(self):
-        """
-         Connect with ADAM Module with IP address the same as DeviceAddress
-         property and sets its state to ON
-        """
-        try:
-            self.connected_ADAM = ModbusTcpClient(self.DeviceAddress,
-                                                  port=int(502))
-        except ModbusException as e:
-            self.set_state(DevState.FAULT)
-            self.set_status("Modbus exception caught while"
-                            " connecting to device: \n%s" % e)
-        except Exception as e:
-            self.set_state(DevState.FAULT)
-            self.set_status(
-                "Exception caught while connecting to device:"
-                + "\n%s" % e)
-        self.set_state(DevState.ON)
-        self.set_status("Connected to device with IP: "
-                        + str(self.DeviceAddress))
-
     @command(dtype_in=int, doc_in='Channel number')
     @DebugIt()
     def ClearCounter(self, value):
@@ -309,53 +371,49 @@ For each DO there are associated attributes:
         else:
             raise ValueError
 
-    @command(polling_period=500)
-    def read_DataFromDevice(self):
+    @command(dtype_in=int, doc_in='Channel mask (bit 0 - channel 0)')
+    @DebugIt()
+    def ClearCounters(self, value):
         """
-         Synchronous reading data from ADAM Module registers
+         Clear counter values of all channels in mask at once, with one
+         write of Clear Counter coils, and read the counters back
         """
-        if self.get_state() == tango.DevState.ON:
-            # read Digital Inputs
-            tmp = self.connected_ADAM.read_coils(0, 8)
-            self.digital_input_values = tmp.bits
-            # read Counter Flags
-            tmp = self.connected_ADAM.read_coils(32, 32)
-            self.counter = tmp.bits[0:8]
-            # read Clear Overflow
-            self.clear_overflow = tmp.bits[17:24]
-            # read Latch Statuses
-            self.latch_status = tmp.bits[25:32]
-            # read Digital Outputs
-            tmp = self.connected_ADAM.read_coils(16, 7)
-            self.digital_output_values = tmp.bits[0:7]
-            # read Counter/Frequency
-            tmp = self.connected_ADAM.read_holding_registers(0, 16)
-            for i in range(0, 7):
-                self.counter_frequency[i] = tmp.registers[2 * i] + 65536  * \
-                                               tmp.registers[2 * i + 1]
-            # read Pulse Output Low
-            tmp = self.connected_ADAM.read_holding_registers(16, 14)
-            for i in range(0, 7):
-                self.pulse_output_low[i] = tmp.registers[2 * i] + 65536  * \
-                                               tmp.registers[2 * i + 1]
-            # read Pulse Output High
-            tmp = self.connected_ADAM.read_holding_registers(30, 14)
-            for i in range(0, 7):
-                self.pulse_output_high[i] = tmp.registers[2 * i] + 65536  * \
-                                           tmp.registers[2 * i + 1]
-            # read Absolute Pulse Output
-            tmp = self.connected_ADAM.read_holding_registers(44, 14)
-            for i in range(0, 7):
-                self.absolute_pulse_output[i] = tmp.registers[2 * i] + 65536 \
-                                            * tmp.registers[2 * i + 1]
-            # read Incremental Pulse Output
-            tmp = self.connected_ADAM.read_holding_registers(58, 14)
-            for i in range(0, 7):
-                self.incremental_pulse_output[i] = tmp.registers[2 * i] \
-                                                   + 65536 * \
-                                                     tmp.registers[2 * i + 1]
-
+        span = mask_span(value, 8)
+        if span is None:
+            raise ValueError
+        first, coils = span
+        self.connected_ADAM.write_coils(40 + first, coils)
+        self.acquisition.fetch(['holding_registers'])
 
+    @command(dtype_in=(int,),
+             doc_in='Channel mask followed by 7 Low Level widths, 7 High '
+                    'Level widths, 7 Absolute and 7 Incremental Pulse values')
+    @DebugIt()
+    def WritePulseConfiguration(self, value):
+        """
+         Write complete Pulse Output configuration of channels selected
+         by the mask (bit 0 - channel 0). Widths are written in one
+         transaction covering only words which differ from cached state,
+         Absolute and Incremental Pulse values of selected channels are
+         always written, as they start pulse trains.
+        """
+        if len(value) != 29:
+            raise ValueError
+        mask = value[0]
+        widths = self.get_pulse_widths()
+        triggers = {}
+        for section in range(0, 4):
+            for channel in range(0, 7):
+                if mask & (1 << channel):
+                    offset = 14 * section + 2 * channel
+                    words = encode_longs([value[1 + 7 * section + channel]])
+                    if section < 2:
+                        widths[offset:offset + 2] = words
+                    else:
+                        triggers[offset - 28] = words[0]
+                        triggers[offset - 27] = words[1]
+        self.write_pulse_widths(widths)
+        self.write_pulse_triggers(triggers)
 
     # ----------
     # Run server
@@ -364,6 +422,7 @@ For each DO there are associated attributes:
 
 def main(args=None, **kwargs):
     from tango.server import run
+    kwargs.setdefault('post_init_callback', registry.auto_connect)
     return run((ADAM6250,), args=args, **kwargs)
 
 if __name__ == '__main__':
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+
+__all__ = ["ADAMAggregator", "main"]
+
+# PyTango imports
+import tango
+from tango import DebugIt
+from tango.server import run
+from tango.server import Device, DeviceMeta
+from tango.server import attribute, command
+from tango.server import class_property, device_property
+from tango import AttrQuality, AttrWriteType, DispLevel, DevState
+
+# Additional import
+import time
+from multiprocessing.pool import ThreadPool
+from registry import registry
+
+
+class ADAMAggregator(Device):
+    """ ADAMAggregator
+It is a definition of a class used to read one quantity (e.g. AnalogInput)
+of many ADAM devices at once.
+Once per cycle values of all channels of all devices are collected into
+Values image attribute (row - device, column - channel), so one read
+returns the whole hall:
+
+ * DeviceNames(str) - name of device of each row of Values
+ * Values(float) - values of all channels of all devices, channels missing
+    on a device are NaN
+ * Timestamps(float) - time of the last read of each device from its module
+
+Devices running in the same server are read directly from their state,
+devices of other servers (listed in Devices property) are read through
+device proxies, in parallel.
+
+"""
+    __metaclass__ = DeviceMeta
+    proxies = {}
+    attribute_lists = {}
+    device_names = []
+    values = []
+    timestamps = []
+
+    # -----------------
+    # Device Properties
+    # -----------------
+
+    Devices = device_property(
+        dtype=(str,),
+        default_value=[],
+        doc="Names of aggregated ADAM devices, empty to aggregate all ADAM "
+            "devices of this server"
+    )
+
+    Quantity = device_property(
+        dtype='str',
+        default_value="AnalogInput",
+        doc="Attribute aggregated from every device, either a spectrum or "
+            "per channel attributes with _N suffix"
+    )
+
+    # ----------
+    # Attributes
+    # ----------
+
+    DeviceNames = attribute(
+        dtype=(str,),
+        access=AttrWriteType.READ,
+        max_dim_x=1024,
+        doc="Names of devices, in order of rows of Values"
+    )
+
+    Values = attribute(
+        dtype=((float,),),
+        access=AttrWriteType.READ,
+        max_dim_x=16,
+        max_dim_y=1024,
+        doc="Values of all channels of all devices (row - device, column - "
+            "channel)"
+    )
+
+    Timestamps = attribute(
+        dtype=(float,),
+        access=AttrWriteType.READ,
+        max_dim_x=1024,
+        doc="Time of last read of each device, in order of rows of Values"
+    )
+
+    # ---------------
+    # General methods
+    # ---------------
+
+    def init_device(self):
+        """Initialise device and sets its state to ON"""
+        Device.init_device(self)
+        self.proxies = {}
+        self.attribute_lists = {}
+        self.device_names = []
+        self.values = []
+        self.timestamps = []
+        # devices of other servers are read in parallel, at most all of them
+        self.pool = ThreadPool(len(self.Devices)) if self.Devices else None
+        self.set_state(DevState.ON)
+        self.set_status("ADAM aggregator of %s" % self.Quantity)
+
+    def delete_device(self):
+        """Stop threads reading devices of other servers"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    # ------------------
+    # Attributes methods
+    # ------------------
+
+    def read_DeviceNames(self):
+        return self.device_names
+
+    def read_Values(self):
+        return self.values
+
+    def read_Timestamps(self):
+        return self.timestamps
+
+    # --------------------
+    # Additional methods
+    # --------------------
+
+    def read_local(self, device):
+        """Return (values, timestamp) of device of this server, None if it
+        has no such quantity, read under the monitor of device like its
+        client requests"""
+        with device.monitor():
+            if device.AcquisitionMode == 'on_demand' and \
+                    device.is_connected():
+                device.acquisition.refresh([self.Quantity],
+                                           device.MaxAge / 1000.0)
+            values = device.get_converted().get(self.Quantity)
+            if values is None:
+                return None
+            return values, device.acquisition.timestamp(self.Quantity)
+
+    def read_remote(self, name):
+        """Return (values, timestamp) of device of other server, None if it
+        has no such quantity or cannot be read"""
+        try:
+            if name not in self.proxies:
+                self.proxies[name] = tango.DeviceProxy(name)
+            proxy = self.proxies[name]
+            if name not in self.attribute_lists:
+                prefix = self.Quantity + '_'
+                channels = [a for a in proxy.get_attribute_list()
+                            if a.startswith(prefix)
+                            and a[len(prefix):].isdigit()]
+                self.attribute_lists[name] = \
+                    sorted(channels, key=lambda a: int(a[len(prefix):])) \
+                    or [self.Quantity]
+            attrs = self.attribute_lists[name]
+            replies = proxy.read_attributes(attrs)
+            if attrs == [self.Quantity]:
+                values = list(replies[0].value)
+            else:
+                values = [reply.value for reply in replies]
+            return values, replies[0].time.totime()
+        except Exception as e:
+            self.debug_stream("Reading %s failed: %s" % (name, e))
+            return None
+
+    # --------
+    # Commands
+    # --------
+
+    @command(polling_period=500)
+    def read_DataFromDevices(self):
+        """
+         Collect values of all devices into image attributes
+        """
+        if self.Devices:
+            names = list(self.Devices)
+        else:
+            names = [device.get_name() for device in registry.all()]
+        remote = [name for name in names if registry.get(name) is None]
+        replies = {}
+        if remote:
+            replies = dict(zip(remote, self.pool.map(self.read_remote,
+                                                     remote)))
+        device_names = []
+        rows = []
+        timestamps = []
+        for name in names:
+            device = registry.get(name)
+            if device is not None:
+                try:
+                    reply = self.read_local(device)
+                except Exception as e:
+                    self.debug_stream("Reading %s failed: %s" % (name, e))
+                    reply = None
+            else:
+                reply = replies.get(name)
+            if reply is None:
+                continue
+            device_names.append(name)
+            rows.append([float(v) for v in reply[0]])
+            timestamps.append(reply[1])
+        width = max([len(row) for row in rows] or [0])
+        self.values = [row + [float('nan')] * (width - len(row))
+                       for row in rows]
+        self.device_names = device_names
+        self.timestamps = timestamps
+
+# ----------
+# Run server
+# ----------
+
+
+def main(args=None, **kwargs):
+    from tango.server import run
+    return run((ADAMAggregator,), args=args, **kwargs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+
+__all__ = ["ADAMFleet", "main"]
+
+# PyTango imports
+import tango
+from tango import DebugIt
+from tango.server import run
+from tango.server import Device, DeviceMeta
+from tango.server import attribute, command
+from tango.server import class_property, device_property
+from tango import AttrQuality, AttrWriteType, DispLevel, DevState
+
+# Additional import
+import time
+from multiprocessing.pool import ThreadPool
+
+
+class ADAMFleet(Device):
+    """ ADAMFleet
+It is a definition of a class used to apply output patterns to many ADAM
+devices at once.
+Patterns are defined in OutputPatterns property, one attribute per line in
+form pattern:Attribute=value, e.g.:
+
+ * safe:DigitalOutput=0,0,0,0,0,0,0
+ * safe:AnalogOutput_0=0.004
+
+Each device listed in Devices property gets only those attributes of the
+pattern which it has. Writes to all devices are done in parallel, so time
+needed to apply a pattern is bounded by the slowest device.
+
+"""
+    __metaclass__ = DeviceMeta
+    proxies = {}
+    attribute_lists = {}
+    patterns = {}
+    last_results = []
+    last_duration = 0.0
+
+    # -----------------
+    # Device Properties
+    # -----------------
+
+    Devices = device_property(
+        dtype=(str,),
+        default_value=[],
+        doc="Names of ADAM devices controlled by the fleet"
+    )
+
+    OutputPatterns = device_property(
+        dtype=(str,),
+        default_value=[],
+        doc="Output patterns, one attribute per line in form "
+            "pattern:Attribute=value"
+    )
+
+    # ----------
+    # Attributes
+    # ----------
+
+    Patterns = attribute(
+        dtype=(str,),
+        access=AttrWriteType.READ,
+        max_dim_x=256,
+        doc="Names of defined output patterns"
+    )
+
+    LastResults = attribute(
+        dtype=(str,),
+        access=AttrWriteType.READ,
+        max_dim_x=1024,
+        doc="Per device result of last ApplyPattern command"
+    )
+
+    LastDuration = attribute(
+        dtype='double',
+        access=AttrWriteType.READ,
+        format='%6.1f',
+        unit='ms',
+        doc="Time needed to apply last pattern to all devices"
+    )
+
+    # ---------------
+    # General methods
+    # ---------------
+
+    def init_device(self):
+        """Initialise device, parse patterns and create device proxies"""
+        Device.init_device(self)
+        self.proxies = {}
+        self.attribute_lists = {}
+        self.last_results = []
+        self.last_duration = 0.0
+        # writes to all devices in parallel
+        self.pool = ThreadPool(max(1, len(self.Devices)))
+        try:
+            self.patterns = self.parse_patterns(self.OutputPatterns)
+        except ValueError as e:
+            self.patterns = {}
+            self.set_state(DevState.FAULT)
+            self.set_status("Invalid OutputPatterns property: %s" % e)
+            return
+        for name in self.Devices:
+            self.proxies[name] = tango.DeviceProxy(name)
+        self.set_state(DevState.ON)
+        self.set_status("ADAM fleet of %d devices, patterns: %s"
+                        % (len(self.proxies),
+                           ', '.join(sorted(self.patterns))))
+
+    def delete_device(self):
+        """Stop threads writing to devices"""
+        self.pool.close()
+        self.pool.join()
+
+    # ------------------
+    # Attributes methods
+    # ------------------
+
+    def read_Patterns(self):
+        return sorted(self.patterns)
+
+    def read_LastResults(self):
+        return self.last_results
+
+    def read_LastDuration(self):
+        return self.last_duration
+
+    # --------------------
+    # Additional methods
+    # --------------------
+
+    def parse_value(self, text):
+        """Convert pattern value to bool, int, float or list of them"""
+        if ',' in text:
+            return [self.parse_value(item) for item in text.split(',')]
+        text = text.strip()
+        if text.lower() in ('true', 'false'):
+            return text.lower() == 'true'
+        try:
+            return int(text)
+        except ValueError:
+            return float(text)
+
+    def parse_patterns(self, lines):
+        """Parse OutputPatterns property into dictionary of pattern name to
+        list of (attribute, value) tuples, raise ValueError naming a
+        malformed line"""
+        patterns = {}
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                name, assignment = line.split(':', 1)
+                attr, value = assignment.split('=', 1)
+                value = self.parse_value(value)
+            except ValueError:
+                raise ValueError("malformed line %r, expected "
+                                 "pattern:Attribute=value" % line)
+            patterns.setdefault(name.strip(), []).append((attr.strip(),
+                                                          value))
+        return patterns
+
+    def apply_to_device(self, name, writes):
+        """Write pattern attributes existing on device, return result line"""
+        start = time.time()
+        try:
+            proxy = self.proxies[name]
+            if name not in self.attribute_lists:
+                self.attribute_lists[name] = \
+                    set(a.lower() for a in proxy.get_attribute_list())
+            existing = self.attribute_lists[name]
+            values = [(a, v) for a, v in writes if a.lower() in existing]
+            if values:
+                proxy.write_attributes(values)
+            result = "OK"
+        except Exception as e:
+            result = "FAILED %s" % e
+        return "%s: %s (%.1f ms)" % (name, result,
+                                     1000.0 * (time.time() - start))
+
+    # --------
+    # Commands
+    # --------
+
+    @command(dtype_in=str, doc_in='Pattern name',
+             dtype_out=(str,), doc_out='Result and time for each device')
+    @DebugIt()
+    def ApplyPattern(self, value):
+        """
+         Apply output pattern to all devices in parallel
+        """
+        if value not in self.patterns:
+            raise ValueError("Unknown pattern: %s" % value)
+        writes = self.patterns[value]
+        names = sorted(self.proxies)
+        start = time.time()
+        results = self.pool.map(
+            lambda name: self.apply_to_device(name, writes), names)
+        self.last_duration = 1000.0 * (time.time() - start)
+        self.last_results = results
+        failed = [r for r in results if ": OK " not in r]
+        if failed:
+            self.set_state(DevState.ALARM)
+            self.set_status("Pattern %s failed on %d of %d devices"
+                            % (value, len(failed), len(names)))
+        else:
+            self.set_state(DevState.ON)
+            self.set_status("Pattern %s applied to %d devices in %.1f ms"
+                            % (value, len(names), self.last_duration))
+        return results
+
+# ----------
+# Run server
+# ----------
+
+
+def main(args=None, **kwargs):
+    from tango.server import run
+    return run((ADAMFleet,), args=args, **kwargs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Host-side limit alarms of channels.
+
+    AlarmEngine compares values of all channels of a device with high and
+    low limits in one numpy pass. A channel enters high alarm above its high
+    limit and leaves it only below (high limit - hysteresis), low alarm
+    likewise, so a value oscillating around a limit does not flood clients
+    with events. NaN limit disables the alarm of a channel.
+"""
+
+import numpy
+
+__all__ = ["limit_array", "AlarmEngine"]
+
+
+def limit_array(values, channels, default):
+    """Return array of limits of channels from property values, a single
+    value applies to all channels, missing ones get default"""
+    limits = numpy.full(channels, default, dtype=numpy.float64)
+    if len(values) == 1:
+        limits[:] = values[0]
+    else:
+        count = min(len(values), channels)
+        limits[:count] = values[:count]
+    return limits
+
+
+class AlarmEngine(object):
+    """Limit alarms with hysteresis of a fixed number of channels"""
+
+    def __init__(self, channels, high=(), low=(), hysteresis=()):
+        self.high_limits = limit_array(high, channels, numpy.nan)
+        self.low_limits = limit_array(low, channels, numpy.nan)
+        self.hysteresis = limit_array(hysteresis, channels, 0.0)
+        self.high = numpy.zeros(channels, dtype=bool)
+        self.low = numpy.zeros(channels, dtype=bool)
+        self.weights = 1 << numpy.arange(channels)
+
+    def evaluate(self, values):
+        """Update alarms from values of all channels, return mask of
+        channels whose alarms changed"""
+        values = numpy.asarray(values, dtype=numpy.float64)
+        with numpy.errstate(invalid='ignore'):
+            high = numpy.where(self.high,
+                               values > self.high_limits - self.hysteresis,
+                               values > self.high_limits)
+            low = numpy.where(self.low,
+                              values < self.low_limits + self.hysteresis,
+                              values < self.low_limits)
+        changed = (high != self.high) | (low != self.low)
+        self.high = high
+        self.low = low
+        return changed
+
+    @property
+    def active(self):
+        """Bool array of channels in high or low alarm"""
+        return self.high | self.low
+
+    @property
+    def high_mask(self):
+        """Bit mask of channels in high alarm (bit 0 - channel 0)"""
+        return int(numpy.dot(self.high, self.weights))
+
+    @property
+    def low_mask(self):
+        """Bit mask of channels in low alarm (bit 0 - channel 0)"""
+        return int(numpy.dot(self.low, self.weights))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Local Modbus broker.
+
+    The broker owns the only connection to each ADAM module and serves local
+    consumers (device servers with BrokerSocket property set, diagnostic
+    scripts using connection.BrokerClient) over a Unix socket. Results of
+    reads are kept for max-age milliseconds, so identical reads of several
+    consumers within one cycle, including concurrent ones, result in one
+    Modbus transaction. A write drops cached reads of its module, and reads
+    of the module running meanwhile are repeated, so no consumer gets data
+    from before the write. Exception responses of the module are returned
+    to consumers as errors.
+
+    The socket is created accessible to the user of the broker only, unless
+    --mode gives other permissions.
+
+    Usage: ADAM-broker [socket] [--max-age ms] [--mode octal]
+"""
+
+import argparse
+import json
+import os
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from pymodbus.exceptions import ModbusException
+
+from acquisition import ReadThroughCache
+from connection import connections, parse_address
+
+__all__ = ["Broker", "main"]
+
+DEFAULT_SOCKET = "/tmp/adam-broker.sock"
+
+READS = ('read_coils', 'read_holding_registers')
+WRITES = ('write_coil', 'write_coils', 'write_register', 'write_registers')
+
+
+class Broker(object):
+    """Executes requests of consumers on shared module connections"""
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.results = {}
+        # number of finished writes of each module
+        self.generations = {}
+        self.cache = ReadThroughCache(self.fetch)
+
+    def client(self, module):
+        """Return client of module given as (host, port, unit)"""
+        with self.lock:
+            if module not in self.clients:
+                host, port, unit = module
+                address = "%s:%d" % (host, port)
+                if unit is not None:
+                    address += "/%d" % unit
+                self.clients[module] = connections.connect(address)
+            return self.clients[module]
+
+    def fetch(self, keys):
+        """Execute reads identified by (module, method, address, count),
+        again if a write to the module finished while they were running"""
+        for key in keys:
+            module, method, address, count = key
+            try:
+                while True:
+                    generation = self.generations.get(module, 0)
+                    response = getattr(self.client(module), method)(address,
+                                                                    count)
+                    if response.isError():
+                        raise ModbusException(str(response))
+                    if self.generations.get(module, 0) == generation:
+                        break
+            except Exception:
+                self.results.pop(key, None)
+                raise
+            if method == 'read_coils':
+                self.results[key] = response.bits[0:count]
+            else:
+                self.results[key] = response.registers
+
+    def forget(self, module):
+        """Drop cached reads of module after a write"""
+        with self.lock:
+            self.generations[module] = self.generations.get(module, 0) + 1
+        keys = [key for key in list(self.results) if key[0] == module]
+        self.cache.invalidate(keys)
+        for key in keys:
+            self.results.pop(key, None)
+
+    def handle(self, request):
+        """Return response to one request of a consumer"""
+        module = parse_address(request['address'])
+        method = request['method']
+        args = request['args']
+        if method in READS:
+            key = (module, method, args[0], args[1])
+            self.cache.refresh([key], self.max_age)
+            result = self.results.get(key)
+            if result is None:
+                return {'error': 'Read of %s failed' % request['address']}
+            field = 'bits' if method == 'read_coils' else 'registers'
+            return {field: result}
+        if method in WRITES:
+            try:
+                response = getattr(self.client(module), method)(*args)
+            finally:
+                self.forget(module)
+            if response.isError():
+                return {'error': 'Write to %s failed: %s'
+                                 % (request['address'], response)}
+            return {}
+        if method == 'readwrite_registers':
+            try:
+                response = self.client(module).readwrite_registers(*args)
+            finally:
+                self.forget(module)
+            if response.isError():
+                return {'exception': str(response),
+                        'exception_code': getattr(response, 'exception_code',
+                                                  None)}
+            return {'registers': response.registers}
+        return {'error': 'Unknown method %s' % method}
+
+
+class BrokerHandler(socketserver.StreamRequestHandler):
+    """Serves requests of one consumer connection"""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            try:
+                response = self.server.broker.handle(
+                    json.loads(line.decode('utf-8')))
+            except Exception as e:
+                response = {'error': str(e)}
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+
+class BrokerServer(socketserver.ThreadingMixIn,
+                   socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, broker, mode=0o600):
+        if os.path.exists(path):
+            os.unlink(path)
+        # bind creates the socket with permissions of the umask
+        umask = os.umask(0o777 & ~mode)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path, BrokerHandler)
+        finally:
+            os.umask(umask)
+        self.broker = broker
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Local broker sharing ADAM module connections")
+    parser.add_argument('socket', nargs='?', default=DEFAULT_SOCKET,
+                        help="Unix socket path (default %(default)s)")
+    parser.add_argument('--max-age', type=float, default=100.0,
+                        help="time in ms for which read results are reused "
+                             "(default %(default)s)")
+    parser.add_argument('--mode', type=lambda text: int(text, 8),
+                        default=0o600,
+                        help="permissions of the socket in octal (default "
+                             "600, the user of the broker only)")
+    options = parser.parse_args(args)
+    server = BrokerServer(options.socket, Broker(options.max_age / 1000.0),
+                          options.mode)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(options.socket)
+
+
+if __name__ == '__main__':
+    main()
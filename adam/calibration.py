@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Per-channel calibration of analog inputs.
+
+    Calibrations property of a device holds one channel per line, applied
+    on top of the nominal range of the channel's Type Code:
+
+     * 0: poly c0 c1 c2 ... - polynomial c0 + c1 * x + c2 * x ** 2 ...
+     * 1: table x0:y0 x1:y1 ... - piecewise-linear interpolation of points
+
+    For every channel the nominal conversion and the calibration are
+    evaluated once for all 65536 raw register values into a float32 lookup
+    table, so converting a value, or an array of buffered values, is a
+    single indexing operation.
+"""
+
+import numpy
+
+__all__ = ["RAW_VALUES", "Calibration", "parse_calibrations", "build_lut"]
+
+# all values of 16-bit register
+RAW_VALUES = numpy.arange(65536, dtype=numpy.float64)
+
+
+class Calibration(object):
+    """Polynomial or interpolation table applied to nominal values"""
+
+    def __init__(self, kind, arguments):
+        if kind == 'poly':
+            if not arguments:
+                raise ValueError("Polynomial calibration needs coefficients")
+            self.coefficients = [float(a) for a in arguments]
+        elif kind == 'table':
+            points = sorted(tuple(float(v) for v in a.split(':'))
+                            for a in arguments)
+            if len(points) < 2 or any(len(p) != 2 for p in points):
+                raise ValueError("Table calibration needs at least two "
+                                 "x:y points")
+            self.x = numpy.array([p[0] for p in points])
+            self.y = numpy.array([p[1] for p in points])
+        else:
+            raise ValueError("Unknown calibration %r" % kind)
+        self.kind = kind
+
+    def apply(self, values):
+        """Return calibrated values (array or scalar)"""
+        if self.kind == 'poly':
+            return numpy.polyval(self.coefficients[::-1], values)
+        return numpy.interp(values, self.x, self.y)
+
+
+def parse_calibrations(lines, channels):
+    """Parse Calibrations property into list of Calibration (or None) per
+    channel"""
+    calibrations = [None] * channels
+    for line in lines:
+        if not line.strip():
+            continue
+        channel, definition = line.split(':', 1)
+        channel = int(channel)
+        if not 0 <= channel < channels:
+            raise ValueError("Invalid channel in calibration %r" % line)
+        words = definition.split()
+        calibrations[channel] = Calibration(words[0], words[1:])
+    return calibrations
+
+
+def build_lut(nominal, calibration=None):
+    """Return float32 lookup table of 65536 values from nominal values of
+    all raw values, with calibration applied"""
+    values = numpy.asarray(nominal, dtype=numpy.float64)
+    if calibration is not None:
+        values = calibration.apply(values)
+    return values.astype(numpy.float32)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Configuration snapshots of ADAM modules.
+
+    Every device class lists its configuration blocks as (address, count)
+    tuples in config_registers and config_coils. Snapshots are stored as
+    compact JSON, holding registers as word lists and coil blocks as
+    integer bit masks, e.g. {"hr":{"200":[386,386]},"co":{"32":255}}.
+"""
+
+import json
+
+import tango
+
+from registers import changed_span, coalesce_blocks
+
+__all__ = ["read_configuration", "dump_configuration", "load_configuration",
+           "restore_configuration", "save_snapshot", "load_snapshot"]
+
+
+def _read_blocks(read, blocks, max_gap):
+    """Read blocks in coalesced transactions and split the result back"""
+    values = {}
+    for address, count in coalesce_blocks(blocks, max_gap):
+        data = read(address, count)
+        for start, length in blocks:
+            if address <= start and start + length <= address + count:
+                values[start] = list(data[start - address:
+                                          start - address + length])
+    return values
+
+
+def _bits_to_mask(bits):
+    return sum(1 << i for i, bit in enumerate(bits) if bit)
+
+
+def _mask_to_bits(mask, count):
+    return [bool(mask & (1 << i)) for i in range(count)]
+
+
+def read_configuration(client, registers, coils):
+    """Read configuration blocks from the module. Coil reads have no side
+    effects so coil blocks are read together across small gaps."""
+    holding = _read_blocks(
+        lambda a, c: client.read_holding_registers(a, c).registers,
+        registers, 0)
+    bits = _read_blocks(lambda a, c: client.read_coils(a, c).bits,
+                        coils, 16)
+    return {"hr": dict((a, holding[a]) for a, c in registers),
+            "co": dict((a, _bits_to_mask(bits[a])) for a, c in coils)}
+
+
+def dump_configuration(configuration):
+    """Serialise configuration to compact JSON"""
+    return json.dumps(
+        {"hr": dict((str(a), v) for a, v in configuration["hr"].items()),
+         "co": dict((str(a), v) for a, v in configuration["co"].items())},
+        separators=(',', ':'), sort_keys=True)
+
+
+def load_configuration(text):
+    """Parse configuration serialised by dump_configuration"""
+    data = json.loads(text)
+    return {"hr": dict((int(a), v) for a, v in data.get("hr", {}).items()),
+            "co": dict((int(a), v) for a, v in data.get("co", {}).items())}
+
+
+def restore_configuration(client, saved, registers, coils):
+    """Write saved configuration to the module with one transaction per
+    changed block. Returns list of differences found."""
+    current = read_configuration(client, registers, coils)
+    differences = []
+    for address, count in registers:
+        if address not in saved["hr"]:
+            continue
+        old = current["hr"][address]
+        new = list(saved["hr"][address])
+        span = changed_span(old, new)
+        if span is None:
+            continue
+        differences.extend(
+            "Register %d: 0x%04x -> 0x%04x" % (address + i, old[i], new[i])
+            for i in range(count) if old[i] != new[i])
+        client.write_registers(address + span[0], new[span[0]:span[1]])
+    for address, count in coils:
+        if address not in saved["co"]:
+            continue
+        old = _mask_to_bits(current["co"][address], count)
+        new = _mask_to_bits(saved["co"][address], count)
+        span = changed_span(old, new)
+        if span is None:
+            continue
+        differences.extend(
+            "Coil %d: %s -> %s" % (address + i, old[i], new[i])
+            for i in range(count) if old[i] != new[i])
+        client.write_coils(address + span[0], new[span[0]:span[1]])
+    return differences
+
+
+def save_snapshot(device, file_name):
+    """Read configuration of device and store it in file_name or, if it is
+    empty, in the Configuration device property"""
+    text = dump_configuration(read_configuration(device.connected_ADAM,
+                                                 device.config_registers,
+                                                 device.config_coils))
+    if file_name:
+        with open(file_name, 'w') as f:
+            f.write(text)
+    else:
+        tango.Database().put_device_property(device.get_name(),
+                                             {'Configuration': [text]})
+    return text
+
+
+def load_snapshot(device, file_name):
+    """Return configuration stored in file_name or, if it is empty, in the
+    Configuration device property"""
+    if file_name:
+        with open(file_name) as f:
+            text = f.read()
+    else:
+        prop = tango.Database().get_device_property(device.get_name(),
+                                                    'Configuration')
+        text = ''.join(prop['Configuration'])
+    if not text:
+        raise ValueError("No configuration snapshot stored")
+    return load_configuration(text)
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Modbus TCP connections shared by ADAM devices.
+
+    DeviceAddress of a device has form host[:port][/unit]. All devices of a
+    process using the same host and port share one socket, e.g. modules
+    behind a Modbus TCP gateway, and requests of different unit IDs are
+    served one at a time, round-robin between units.
+
+    Shared sockets use TCP keepalive tuned to the connection timeout, and a
+    socket is closed as soon as a request on it fails, e.g. on a half-open
+    connection after a switch reboot or module power loss, so the next
+    request opens a new one.
+
+    Alternatively devices (and scripts) may reach modules through a local
+    broker process (see broker module) owning the only connection to each
+    module. Broker protocol uses one JSON object per line, request:
+    {"address": "host:port/unit", "method": "read_coils", "args": [0, 8]},
+    response: {"bits": [...]}, {"registers": [...]}, {} or {"error": "..."}.
+"""
+
+import json
+import socket
+import threading
+from collections import deque
+
+from pymodbus.client.sync import ModbusTcpClient
+from pymodbus.exceptions import ModbusException, ModbusIOException
+
+__all__ = ["parse_address", "FairScheduler", "set_keepalive",
+           "SharedConnection", "UnitClient", "BrokerResponse", "BrokerClient",
+           "ConnectionManager", "connections"]
+
+
+def parse_address(address, port=502):
+    """Split address of form host[:port][/unit] into (host, port, unit),
+    unit is None when not given"""
+    unit = None
+    if '/' in address:
+        address, unit = address.rsplit('/', 1)
+        unit = int(unit)
+    if ':' in address:
+        address, port = address.rsplit(':', 1)
+    return address.strip(), int(port), unit
+
+
+class FairScheduler(object):
+    """Grants a shared connection to one request at a time. Requests of one
+    unit are served in order, units are served round-robin."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.queues = {}
+        self.rotation = deque()
+        self.busy = False
+
+    def acquire(self, unit):
+        ticket = object()
+        with self.condition:
+            if unit not in self.queues:
+                self.queues[unit] = deque()
+                self.rotation.append(unit)
+            self.queues[unit].append(ticket)
+            while self.busy or \
+                    self.queues[self.rotation[0]][0] is not ticket:
+                self.condition.wait()
+            self.busy = True
+            self.rotation.popleft()
+            self.queues[unit].popleft()
+            if self.queues[unit]:
+                self.rotation.append(unit)
+            else:
+                del self.queues[unit]
+
+    def release(self):
+        with self.condition:
+            self.busy = False
+            self.condition.notify_all()
+
+
+def set_keepalive(sock, timeout):
+    """Tune TCP keepalive of socket, so a dead peer is detected in about
+    timeout seconds, where the platform supports it"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    options = (('TCP_KEEPIDLE', max(1, int(timeout / 2))),
+               ('TCP_KEEPINTVL', max(1, int(timeout / 4))),
+               ('TCP_KEEPCNT', 2),
+               ('TCP_USER_TIMEOUT', int(1000 * timeout)))
+    for name, value in options:
+        if hasattr(socket, name):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+
+
+class SharedConnection(object):
+    """Modbus TCP client of one host:port shared by many devices"""
+
+    def __init__(self, host, port, timeout=3.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.client = ModbusTcpClient(host, port=port, timeout=timeout)
+        self.scheduler = FairScheduler()
+        self.users = 0
+
+    def set_timeout(self, timeout):
+        """Lower timeout of requests, applied when socket is (re)opened"""
+        if timeout < self.timeout:
+            self.timeout = timeout
+            self.client.timeout = timeout
+
+    def execute(self, unit, method, *args, **kwargs):
+        """Call client method for unit with exclusive access to socket,
+        closing the socket if the request fails"""
+        if unit is not None:
+            kwargs['unit'] = unit
+        self.scheduler.acquire(unit)
+        try:
+            if self.client.socket is None and self.client.connect():
+                set_keepalive(self.client.socket, self.timeout)
+            response = getattr(self.client, method)(*args, **kwargs)
+            if isinstance(response, ModbusIOException):
+                raise response
+            return response
+        except Exception:
+            self.client.close()
+            raise
+        finally:
+            self.scheduler.release()
+
+    def close(self):
+        self.client.close()
+
+
+class UnitClient(object):
+    """Client of one Modbus unit with interface of ModbusTcpClient"""
+
+    def __init__(self, manager, connection, unit):
+        self.manager = manager
+        self.connection = connection
+        self.unit = unit
+        self.closed = False
+
+    def read_coils(self, address, count=1):
+        return self.connection.execute(self.unit, 'read_coils',
+                                       address, count)
+
+    def read_holding_registers(self, address, count=1):
+        return self.connection.execute(self.unit, 'read_holding_registers',
+                                       address, count)
+
+    def write_coil(self, address, value):
+        return self.connection.execute(self.unit, 'write_coil',
+                                       address, value)
+
+    def write_coils(self, address, values):
+        return self.connection.execute(self.unit, 'write_coils',
+                                       address, values)
+
+    def write_register(self, address, value):
+        return self.connection.execute(self.unit, 'write_register',
+                                       address, value)
+
+    def write_registers(self, address, values):
+        return self.connection.execute(self.unit, 'write_registers',
+                                       address, values)
+
+    def readwrite_registers(self, read_address, read_count, write_address,
+                            values):
+        return self.connection.execute(self.unit, 'readwrite_registers',
+                                       read_address=read_address,
+                                       read_count=read_count,
+                                       write_address=write_address,
+                                       write_registers=values)
+
+    def close(self):
+        """Release shared connection, socket is closed by last user"""
+        if not self.closed:
+            self.closed = True
+            self.manager.release(self.connection)
+
+
+class BrokerResponse(object):
+    """Response of broker with interface of pymodbus read responses"""
+
+    def __init__(self, data):
+        self.bits = data.get('bits')
+        self.registers = data.get('registers')
+        self.exception = data.get('exception')
+        self.exception_code = data.get('exception_code')
+
+    def isError(self):
+        return self.exception is not None
+
+
+class BrokerClient(object):
+    """Client of one Modbus unit served by a local broker process, with
+    interface of ModbusTcpClient"""
+
+    def __init__(self, path, address):
+        self.path = path
+        self.address = address
+        self.lock = threading.Lock()
+        self.socket = None
+        self.stream = None
+
+    def request(self, method, *args):
+        """Send request to broker and return its response"""
+        line = json.dumps({'address': self.address, 'method': method,
+                           'args': list(args)}) + '\n'
+        with self.lock:
+            try:
+                if self.socket is None:
+                    self.socket = socket.socket(socket.AF_UNIX,
+                                                socket.SOCK_STREAM)
+                    self.socket.connect(self.path)
+                    self.stream = self.socket.makefile('rb')
+                self.socket.sendall(line.encode('utf-8'))
+                reply = self.stream.readline()
+            except socket.error:
+                self.close()
+                raise
+        if not reply:
+            self.close()
+            raise ModbusException("Connection to broker %s closed"
+                                  % self.path)
+        data = json.loads(reply.decode('utf-8'))
+        if 'error' in data:
+            raise ModbusException(data['error'])
+        return BrokerResponse(data)
+
+    def read_coils(self, address, count=1):
+        return self.request('read_coils', address, count)
+
+    def read_holding_registers(self, address, count=1):
+        return self.request('read_holding_registers', address, count)
+
+    def write_coil(self, address, value):
+        return self.request('write_coil', address, bool(value))
+
+    def write_coils(self, address, values):
+        return self.request('write_coils', address,
+                            [bool(v) for v in values])
+
+    def write_register(self, address, value):
+        return self.request('write_register', address, value)
+
+    def write_registers(self, address, values):
+        return self.request('write_registers', address, list(values))
+
+    def readwrite_registers(self, read_address, read_count, write_address,
+                            values):
+        return self.request('readwrite_registers', read_address, read_count,
+                            write_address, list(values))
+
+    def close(self):
+        if self.socket is not None:
+            self.stream.close()
+            self.socket.close()
+            self.socket = None
+            self.stream = None
+
+
+class ConnectionManager(object):
+    """Creates one SharedConnection per host:port and counts its users"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = {}
+
+    def connect(self, address, broker='', timeout=3.0):
+        """Return client for DeviceAddress of form host[:port][/unit], going
+        through broker listening on given Unix socket path if it is set.
+        Shared connection uses the lowest timeout (in seconds) of its
+        users."""
+        if broker:
+            return BrokerClient(broker, address)
+        host, port, unit = parse_address(address)
+        with self.lock:
+            connection = self.connections.get((host, port))
+            if connection is None:
+                connection = SharedConnection(host, port, timeout)
+                self.connections[(host, port)] = connection
+            connection.set_timeout(timeout)
+            connection.users += 1
+        return UnitClient(self, connection, unit)
+
+    def release(self, connection):
+        with self.lock:
+            connection.users -= 1
+            if connection.users > 0:
+                return
+            del self.connections[(connection.host, connection.port)]
+        connection.close()
+
+
+connections = ConnectionManager()
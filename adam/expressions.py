@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Derived channels computed from channels of the same device.
+
+    DerivedChannels property of a device holds one channel per line in form
+    Name = expression, e.g.:
+
+     * DeltaP = AnalogInput_0 - AnalogInput_1
+     * Flow = 0.25 * CounterFrequency[3]
+
+    Expressions may use numbers, + - * / ** %, functions abs, sqrt, exp,
+    log, log10, sin, cos, tan, min and max, constants pi and e, and values
+    of the device attributes: Attribute_N for a channel, Attribute (with
+    optional integer index, e.g. [3] or [-1]) for a spectrum. They are checked against this
+    whitelist and compiled once; evaluation uses numpy functions, so the
+    same expression works on scalars and on arrays of buffered data.
+    Numbers (except indexes) are compiled as floats, so no operation runs
+    Python's unbounded integer arithmetic (e.g. 9 ** 9 ** 9 overflows at
+    once instead of computing for hours).
+
+    Derived channels must not be named like attributes of the device.
+"""
+
+import ast
+import numbers
+
+import numpy
+
+__all__ = ["Expression", "split_variable", "DerivedChannels"]
+
+FUNCTIONS = {'abs': numpy.abs, 'sqrt': numpy.sqrt, 'exp': numpy.exp,
+             'log': numpy.log, 'log10': numpy.log10, 'sin': numpy.sin,
+             'cos': numpy.cos, 'tan': numpy.tan, 'min': numpy.minimum,
+             'max': numpy.maximum}
+CONSTANTS = {'pi': numpy.pi, 'e': numpy.e}
+
+NODES = tuple(getattr(ast, name) for name in (
+    'Expression', 'BinOp', 'UnaryOp', 'Call', 'Name', 'Load', 'Subscript',
+    'Index', 'Num', 'Constant', 'Add', 'Sub', 'Mult', 'Div', 'Pow', 'Mod',
+    'UAdd', 'USub') if hasattr(ast, name))
+NUMBERS = tuple(getattr(ast, name) for name in ('Num', 'Constant')
+                if hasattr(ast, name))
+
+
+def constant_index(node):
+    """Return value of index node if it is an integer constant (or a
+    negated one), None otherwise"""
+    if hasattr(ast, 'Index') and isinstance(node, ast.Index):
+        node = node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        node = node.operand
+        sign = -1
+    else:
+        sign = 1
+    if not isinstance(node, NUMBERS):
+        return None
+    value = getattr(node, 'value', getattr(node, 'n', None))
+    if not isinstance(value, numbers.Integral) or isinstance(value, bool) or \
+            sign < 0 and value < 0:
+        return None
+    return sign * value
+
+
+class Expression(object):
+    """Arithmetic expression checked against whitelist and compiled"""
+
+    def __init__(self, text):
+        self.text = text.strip()
+        try:
+            tree = ast.parse(self.text, mode='eval')
+        except SyntaxError as e:
+            raise ValueError("Invalid expression %r: %s" % (self.text, e))
+        variables = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, NODES):
+                raise ValueError("%s not allowed in expression %r"
+                                 % (type(node).__name__, self.text))
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or \
+                        node.func.id not in FUNCTIONS or node.keywords or \
+                        getattr(node, 'starargs', None) or \
+                        getattr(node, 'kwargs', None):
+                    raise ValueError("Invalid call in expression %r"
+                                     % self.text)
+            elif isinstance(node, ast.Subscript):
+                if not isinstance(node.value, ast.Name) or \
+                        constant_index(node.slice) is None:
+                    raise ValueError("Invalid index in expression %r"
+                                     % self.text)
+            elif hasattr(ast, 'Constant') and \
+                    isinstance(node, ast.Constant):
+                if not isinstance(node.value, (int, float)) or \
+                        isinstance(node.value, bool):
+                    raise ValueError("Invalid constant in expression %r"
+                                     % self.text)
+            elif isinstance(node, ast.Name) and \
+                    node.id not in FUNCTIONS and node.id not in CONSTANTS:
+                variables.add(node.id)
+        self.variables = sorted(variables)
+        indexes = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Subscript):
+                indexes.update(id(index) for index in ast.walk(node.slice))
+        for node in ast.walk(tree):
+            if id(node) in indexes:
+                continue
+            for field in node._fields:
+                value = getattr(node, field)
+                if isinstance(value, numbers.Integral) and \
+                        not isinstance(value, bool):
+                    setattr(node, field, float(value))
+        self.code = compile(tree, '<%s>' % self.text, 'eval')
+
+    def evaluate(self, variables):
+        """Evaluate expression for values (scalars or arrays) of its
+        variables"""
+        namespace = dict(FUNCTIONS)
+        namespace.update(CONSTANTS)
+        namespace.update(variables)
+        namespace['__builtins__'] = {}
+        with numpy.errstate(all='ignore'):
+            return eval(self.code, namespace)
+
+
+def split_variable(name):
+    """Split variable name into attribute and channel (None for a whole
+    attribute), e.g. AnalogInput_3 into ('AnalogInput', 3)"""
+    base, sep, channel = name.rpartition('_')
+    if sep and channel.isdigit():
+        return base, int(channel)
+    return name, None
+
+
+class DerivedChannels(object):
+    """Derived channels of a device parsed from DerivedChannels property"""
+
+    def __init__(self, lines):
+        self.channels = []
+        for line in lines:
+            if not line.strip():
+                continue
+            if '=' not in line:
+                raise ValueError("Derived channel %r is not in form "
+                                 "Name = expression" % line)
+            name, text = line.split('=', 1)
+            self.channels.append((name.strip(), Expression(text)))
+        self.names = [name for name, expression in self.channels]
+
+    def check_names(self, reserved):
+        """Raise ValueError if a derived channel (or the attribute part of
+        its Attribute_N name) is among reserved names of the device"""
+        for name in self.names:
+            if name in reserved or split_variable(name)[0] in reserved or \
+                    self.names.count(name) > 1:
+                raise ValueError("Derived channel %s clashes with an "
+                                 "attribute of the device" % name)
+
+    def attribute_groups(self, attribute_groups):
+        """Return attribute_groups extended by derived channels, each needs
+        the register groups of attributes it uses"""
+        groups = dict(attribute_groups)
+        for name, expression in self.channels:
+            needed = set()
+            for variable in expression.variables:
+                base = split_variable(variable)[0]
+                if base not in attribute_groups:
+                    raise ValueError("Unknown attribute %s in derived "
+                                     "channel %s" % (variable, name))
+                needed.update(attribute_groups[base])
+            groups[name] = tuple(sorted(needed))
+        return groups
+
+    def evaluate(self, converted):
+        """Return values of derived channels computed from converted values
+        of the device, NaN where a value cannot be computed"""
+        values = {}
+        for name, expression in self.channels:
+            try:
+                variables = {}
+                for variable in expression.variables:
+                    base, channel = split_variable(variable)
+                    value = converted[base]
+                    if channel is not None:
+                        value = value[channel]
+                    variables[variable] = numpy.asarray(value,
+                                                        dtype=numpy.float64)
+                values[name] = float(expression.evaluate(variables))
+            except Exception:
+                values[name] = float('nan')
+        return values
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Streaming filters of analog input channels.
+
+    Filters property of a device holds one channel per line with a chain
+    of filter stages applied, in order, to every sample acquired from the
+    channel:
+
+     * 0: average 10 - moving average of last 10 samples
+     * 1: median 5, iir 0.2 - median of last 5 samples, then first-order
+       low-pass y += 0.2 * (x - y)
+     * 2: iir 0.05, decimate 10 - low-pass, output updated every 10 samples
+
+    Every stage keeps state of fixed size and updates it in constant time
+    (median sorts its window of few samples).
+"""
+
+from collections import deque
+
+__all__ = ["MovingAverage", "Median", "LowPass", "Decimation", "FilterChain",
+           "parse_filters"]
+
+
+class MovingAverage(object):
+    """Average of last size samples, kept as running sum"""
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self.total = 0.0
+
+    def update(self, value):
+        if len(self.samples) == self.samples.maxlen:
+            self.total -= self.samples[0]
+        self.samples.append(value)
+        self.total += value
+        return self.total / len(self.samples)
+
+
+class Median(object):
+    """Median of last size samples"""
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+
+    def update(self, value):
+        self.samples.append(value)
+        return sorted(self.samples)[len(self.samples) // 2]
+
+
+class LowPass(object):
+    """First-order IIR low-pass filter y += alpha * (x - y)"""
+
+    def __init__(self, alpha):
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError("IIR coefficient must be in (0, 1]")
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class Decimation(object):
+    """Passes every factor-th sample, None for the others"""
+
+    def __init__(self, factor):
+        self.factor = factor
+        self.count = 0
+
+    def update(self, value):
+        self.count += 1
+        if self.count < self.factor:
+            return None
+        self.count = 0
+        return value
+
+
+STAGES = {'average': (MovingAverage, int), 'median': (Median, int),
+          'iir': (LowPass, float), 'decimate': (Decimation, int)}
+
+
+class FilterChain(object):
+    """Filter stages of one channel"""
+
+    def __init__(self, definition):
+        self.stages = []
+        for stage in definition.split(','):
+            words = stage.split()
+            if len(words) != 2 or words[0] not in STAGES:
+                raise ValueError("Invalid filter stage %r" % stage.strip())
+            cls, convert = STAGES[words[0]]
+            argument = convert(words[1])
+            if argument <= 0:
+                raise ValueError("Invalid filter stage %r" % stage.strip())
+            self.stages.append(cls(argument))
+
+    def update(self, value):
+        """Filter next sample, return new output or None if decimation
+        dropped it"""
+        for stage in self.stages:
+            value = stage.update(value)
+            if value is None:
+                return None
+        return value
+
+
+def parse_filters(lines, channels):
+    """Parse Filters property into list of FilterChain (or None) per
+    channel"""
+    filters = [None] * channels
+    for line in lines:
+        if not line.strip():
+            continue
+        channel, definition = line.split(':', 1)
+        channel = int(channel)
+        if not 0 <= channel < channels:
+            raise ValueError("Invalid channel in filter %r" % line)
+        filters[channel] = FilterChain(definition)
+    return filters
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Per-device Modbus I/O worker.
+
+    All requests of a device are executed by one worker thread, so access to
+    the socket is serialised. Waiting requests are served by priority:
+    writes and commands first, then reads of clients, then background
+    polling reads, so an output command never waits behind a queued poll.
+
+    When no request was executed for half of period (the request timeout),
+    the worker sends a tiny heartbeat read (checked in slots of the poll
+    scheduler), so a dead module is detected (and its socket closed) within
+    twice the period even when the device is not polled. The alive flag
+    tells whether the last request succeeded.
+
+    Results of polls are stored by the delivery thread of the worker, which
+    runs queued calls in order outside the I/O thread, so they may wait for
+    locks (e.g. the Tango device monitor) held by callers waiting for the
+    worker. Requests submitted after close fail at once.
+
+    Verified writes use Read/Write Multiple Registers (function 23) to
+    write registers and read them back in one transaction. After a module
+    answered it with Illegal Function, they fall back to a write and a read
+    of the written range.
+"""
+
+import itertools
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from pymodbus.exceptions import ModbusException
+from pymodbus.pdu import ModbusExceptions
+
+from scheduler import scheduler
+
+__all__ = ["Request", "IOWorker"]
+
+
+class Request(object):
+    """Queued call, wait() returns its result or raises its exception. time
+    is the time when the call returned (e.g. Modbus response arrived)."""
+
+    def __init__(self, function, args, callback=None):
+        self.function = function
+        self.args = args
+        self.callback = callback
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.time = None
+
+    def execute(self):
+        try:
+            self.result = self.function(*self.args)
+        except Exception as e:
+            self.error = e
+        self.time = time.time()
+        self.event.set()
+        if self.callback is not None:
+            self.callback(self)
+
+    def fail(self, error):
+        self.error = error
+        self.event.set()
+        if self.callback is not None:
+            self.callback(self)
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class IOWorker(object):
+    """Executes Modbus requests of one device in priority order, with
+    interface of ModbusTcpClient"""
+
+    STOP = -1
+    WRITE = 0
+    READ = 1
+    POLL = 2
+
+    def __init__(self, client, name="ADAM I/O", heartbeat=None, period=None):
+        self.client = client
+        self.heartbeat = heartbeat
+        self.period = period
+        self.alive = True
+        self.last_response = time.time()
+        self.read_write = True
+        self.lock = threading.Lock()
+        self.closed = False
+        self.queue = queue.PriorityQueue()
+        self.deliveries = queue.Queue()
+        self.sequence = itertools.count()
+        self.thread = threading.Thread(target=self.run, name=name)
+        self.thread.daemon = True
+        self.thread.start()
+        self.delivery = threading.Thread(target=self.run_deliveries,
+                                         name=name + " delivery")
+        self.delivery.daemon = True
+        self.delivery.start()
+        if heartbeat:
+            scheduler.add(self, self.beat_slot, period / 2.0)
+
+    def run(self):
+        while True:
+            priority, number, request = self.queue.get()
+            if priority == self.STOP:
+                break
+            request.execute()
+        while not self.queue.empty():
+            request = self.queue.get()[2]
+            if request is not None:
+                request.fail(IOError("I/O worker stopped"))
+
+    def run_deliveries(self):
+        while True:
+            request = self.deliveries.get()
+            if request is None:
+                break
+            request.execute()
+
+    def execute(self, method, *args):
+        try:
+            response = getattr(self.client, method)(*args)
+        except Exception:
+            self.alive = False
+            raise
+        finally:
+            self.last_response = time.time()
+        self.alive = True
+        return response
+
+    def write_and_read(self, address, values):
+        """Write registers and return values read back from them"""
+        if self.read_write:
+            response = self.execute('readwrite_registers', address,
+                                    len(values), address, values)
+            if not response.isError():
+                return list(response.registers[:len(values)])
+            if getattr(response, 'exception_code', None) != \
+                    ModbusExceptions.IllegalFunction:
+                raise ModbusException("Write of registers %d-%d failed: %s"
+                                      % (address, address + len(values) - 1,
+                                         response))
+            self.read_write = False
+        for method, args in (('write_registers', (address, values)),
+                             ('read_holding_registers',
+                              (address, len(values)))):
+            response = self.execute(method, *args)
+            if response.isError():
+                raise ModbusException("Write of registers %d-%d failed: %s"
+                                      % (address, address + len(values) - 1,
+                                         response))
+        return list(response.registers[:len(values)])
+
+    def beat(self):
+        """Execute heartbeat read given as (method, address, count)"""
+        try:
+            self.execute(*self.heartbeat)
+        except Exception:
+            pass
+
+    def beat_slot(self):
+        """Queue heartbeat read if worker is idle, so it is sent at most
+        period after the last response"""
+        if self.queue.empty() and \
+                time.time() - self.last_response >= self.period / 2.0:
+            self.submit(self.POLL, self.beat)
+
+    def submit(self, priority, function, *args, **kwargs):
+        """Queue call of function with given priority, return Request"""
+        request = Request(function, args, kwargs.get('callback'))
+        with self.lock:
+            if not self.closed:
+                self.queue.put((priority, next(self.sequence), request))
+                return request
+        request.fail(IOError("I/O worker stopped"))
+        return request
+
+    def deliver(self, function, *args, **kwargs):
+        """Queue call of function in the delivery thread, return Request"""
+        request = Request(function, args, kwargs.get('callback'))
+        with self.lock:
+            if not self.closed:
+                self.deliveries.put(request)
+                return request
+        request.fail(IOError("I/O worker stopped"))
+        return request
+
+    def call(self, priority, method, *args):
+        """Execute client method with given priority and return result"""
+        return self.submit(priority, self.execute, method, *args).wait()
+
+    def read_coils(self, address, count=1, priority=READ):
+        return self.call(priority, 'read_coils', address, count)
+
+    def read_holding_registers(self, address, count=1, priority=READ):
+        return self.call(priority, 'read_holding_registers', address, count)
+
+    def write_coil(self, address, value):
+        return self.call(self.WRITE, 'write_coil', address, value)
+
+    def write_coils(self, address, values):
+        return self.call(self.WRITE, 'write_coils', address, values)
+
+    def write_register(self, address, value):
+        return self.call(self.WRITE, 'write_register', address, value)
+
+    def write_registers(self, address, values):
+        return self.call(self.WRITE, 'write_registers', address, values)
+
+    def write_registers_verified(self, address, values):
+        """Write registers, return their values read back by the module"""
+        return self.submit(self.WRITE, self.write_and_read, address,
+                           list(values)).wait()
+
+    def close(self):
+        """Stop worker thread, failing queued requests, and close client.
+        Queued deliveries still run, they check closed."""
+        scheduler.remove(self)
+        with self.lock:
+            self.closed = True
+        self.deliveries.put(None)
+        if self.thread.is_alive():
+            self.queue.put((self.STOP, next(self.sequence), None))
+            if self.thread is not threading.current_thread():
+                self.thread.join()
+        self.client.close()
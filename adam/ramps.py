@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Ramping of analog outputs.
+
+    RampEngine moves output values of channels toward their targets by at
+    most rate times the time elapsed since their previous step (or start),
+    so a step skipped while the previous write was running is made up by
+    the next one. The device calls step in ticks of the poll scheduler and
+    writes the new values of all ramping channels to the module in one
+    transaction.
+"""
+
+import threading
+import time
+
+__all__ = ["RampEngine"]
+
+
+class RampEngine(object):
+    """Positions and targets of ramping channels, rates are in units of
+    the output per second, rate 0 means no ramping"""
+
+    def __init__(self, rates, channels):
+        if len(rates) == 1:
+            rates = list(rates) * channels
+        self.rates = [abs(float(r)) for r in rates][:channels]
+        self.rates += [0.0] * (channels - len(self.rates))
+        self.lock = threading.RLock()
+        self.targets = {}
+        self.positions = {}
+        self.times = {}
+
+    def start(self, channel, position, target):
+        """Start ramp of channel from present position to target, a ramping
+        channel continues from its last step"""
+        with self.lock:
+            if channel not in self.targets:
+                self.positions[channel] = position
+                self.times[channel] = time.time()
+            self.targets[channel] = target
+
+    def abort(self, channel=None):
+        """Stop ramp of channel (of all channels if None) at its present
+        position"""
+        with self.lock:
+            for ch in [channel] if channel is not None else list(self.targets):
+                self.targets.pop(ch, None)
+                self.positions.pop(ch, None)
+                self.times.pop(ch, None)
+
+    def target(self, channel):
+        """Return target of ramping channel, None if it is not ramping"""
+        return self.targets.get(channel)
+
+    def step(self, now=None):
+        """Move ramping channels by the time elapsed until now (default
+        present time), return their new positions; channels reaching target
+        stop ramping"""
+        now = now or time.time()
+        with self.lock:
+            positions = {}
+            for channel, target in list(self.targets.items()):
+                position = self.positions[channel]
+                delta = self.rates[channel] * \
+                    max(0.0, now - self.times[channel])
+                if abs(target - position) <= delta:
+                    position = target
+                    self.abort(channel)
+                else:
+                    position += delta if target > position else -delta
+                    self.positions[channel] = position
+                    self.times[channel] = now
+                positions[channel] = position
+            return positions
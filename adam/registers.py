@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Helpers shared by ADAM device classes for packing Modbus register words,
+    computing which parts of a register block have to be rewritten or read
+    and decoding status words.
+"""
+
+__all__ = ["encode_longs", "decode_longs", "changed_span", "mask_span",
+           "index_runs", "coalesce_blocks", "StatusTable"]
+
+
+def encode_longs(values):
+    """Split 32-bit values into (low word, high word) register pairs"""
+    words = []
+    for value in values:
+        value = int(value)
+        words.extend((value & 0xffff, (value >> 16) & 0xffff))
+    return words
+
+
+def decode_longs(registers):
+    """Join (low word, high word) register pairs into 32-bit values"""
+    return [registers[i] + 65536 * registers[i + 1]
+            for i in range(0, len(registers) - 1, 2)]
+
+
+def changed_span(cached, new):
+    """Return (start, stop) of the smallest slice of new differing from
+    cached, or None when both are identical. Without cached state the whole
+    block is returned."""
+    if cached is None or len(cached) != len(new):
+        return (0, len(new))
+    changed = [i for i in range(len(new)) if cached[i] != new[i]]
+    if not changed:
+        return None
+    return (changed[0], changed[-1] + 1)
+
+
+def mask_span(mask, channels):
+    """Return (first channel, bools of channels first..last) of the
+    smallest span covering channels set in mask (bit 0 - channel 0), so
+    they are written in one write_coils; None when mask has no channel"""
+    if not 0 < mask < 1 << channels:
+        return None
+    selected = [bool(mask >> i & 1) for i in range(0, channels)]
+    first = selected.index(True)
+    last = channels - 1 - selected[::-1].index(True)
+    return first, selected[first:last + 1]
+
+
+def index_runs(indexes):
+    """Return (start, stop) of each run of consecutive indexes, so only the
+    selected words are written, one transaction per run"""
+    runs = []
+    for index in sorted(indexes):
+        if runs and runs[-1][1] == index:
+            runs[-1][1] = index + 1
+        else:
+            runs.append([index, index + 1])
+    return [tuple(run) for run in runs]
+
+
+def coalesce_blocks(blocks, max_gap=0):
+    """Merge (address, count) blocks separated by at most max_gap
+    addresses into as few blocks as possible"""
+    merged = []
+    for address, count in sorted(blocks):
+        if merged and address <= merged[-1][0] + merged[-1][1] + max_gap:
+            start = merged[-1][0]
+            stop = max(merged[-1][0] + merged[-1][1], address + count)
+            merged[-1] = (start, stop - start)
+        else:
+            merged.append((address, count))
+    return merged
+
+
+class StatusTable(object):
+    """Descriptions and flag arrays precomputed for every combination of
+    status bits, so decoding a status word is a single tuple lookup.
+
+    flags maps bit value to its description, description of value 0 is used
+    when no known bit is set. Bits not present in flags are ignored."""
+
+    __slots__ = ("bits", "mask", "descriptions", "flag_arrays")
+
+    def __init__(self, flags):
+        self.bits = tuple(sorted(bit for bit in flags if bit))
+        size = 1
+        for bit in self.bits:
+            size = max(size, 2 * bit)
+        self.mask = size - 1
+        blank = flags.get(0, ' ')
+        descriptions = []
+        flag_arrays = []
+        for value in range(size):
+            active = [flags[bit] for bit in self.bits if value & bit]
+            descriptions.append(', '.join(active) or blank)
+            flag_arrays.append(tuple(bool(value & bit) for bit in self.bits))
+        self.descriptions = tuple(descriptions)
+        self.flag_arrays = tuple(flag_arrays)
+
+    def describe(self, value):
+        """Return description of all flags set in status word"""
+        return self.descriptions[value & self.mask]
+
+    def flags(self, value):
+        """Return tuple of bools, one for each known flag bit"""
+        return self.flag_arrays[value & self.mask]
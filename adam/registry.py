@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Registry of ADAM devices running in the process.
+
+    Devices register themselves in init_device and unregister in
+    delete_device, so other devices of the same server (e.g. ADAMAggregator)
+    can use their data directly instead of reading them through CORBA.
+
+    When the server starts, auto_connect connects all devices with
+    AutoConnect property set at once, each in its own thread, so starting a
+    server of many modules takes about one connect timeout.
+"""
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+__all__ = ["DeviceRegistry", "registry"]
+
+
+class DeviceRegistry(object):
+    """ADAM devices of the process, by lower case device name"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.devices = {}
+
+    def register(self, device):
+        with self.lock:
+            self.devices[device.get_name().lower()] = device
+
+    def unregister(self, device):
+        with self.lock:
+            if self.devices.get(device.get_name().lower()) is device:
+                del self.devices[device.get_name().lower()]
+
+    def get(self, name):
+        """Return device of given name, None if it is not in the process"""
+        with self.lock:
+            return self.devices.get(name.lower())
+
+    def all(self):
+        """Return all registered devices sorted by name"""
+        with self.lock:
+            return [self.devices[name] for name in sorted(self.devices)]
+
+    def auto_connect(self):
+        """Connect all devices with AutoConnect property set concurrently,
+        each device reads all its registers before it reports ON"""
+        devices = [device for device in self.all()
+                   if getattr(device, 'AutoConnect', False)]
+        if not devices:
+            return
+        pool = ThreadPool(len(devices))
+        try:
+            pool.map(lambda device: device.ConnectWithDevice(), devices)
+        finally:
+            pool.close()
+
+
+registry = DeviceRegistry()
@@ -6,12 +6,17 @@
 from adam_6217 import ADAM6217
 from adam_6224 import ADAM6224
 from adam_6250 import ADAM6250
+from adam_fleet import ADAMFleet
+from adam_aggregator import ADAMAggregator
+from registry import registry
 
 from tango.server import run
 
 def main(args=None, **kwargs):
+    kwargs.setdefault('post_init_callback', registry.auto_connect)
     return run({'ADAM6217': ADAM6217, 'ADAM6224': ADAM6224,
-                'ADAM6250': ADAM6250 },
+                'ADAM6250': ADAM6250, 'ADAMFleet': ADAMFleet,
+                'ADAMAggregator': ADAMAggregator},
                args=args, **kwargs)
 
 if __name__ =='__main__':
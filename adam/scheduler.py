@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Fixed-rate scheduler of polling cycles.
+
+    Cycles of a job run in slots of a wall-clock grid: at times t for which
+    (t - phase) is a multiple of the period, so jobs with the same period
+    and phase, e.g. all devices of a server, poll at the same instants and
+    the period does not stretch with the time spent in a cycle. Slots which
+    have passed while a cycle was running are skipped and counted as missed
+    instead of being run in a burst. One thread runs jobs of the whole
+    process, so callbacks should only queue work (see Acquisition.poll).
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+
+__all__ = ["next_slot", "Job", "PollScheduler", "scheduler"]
+
+
+def next_slot(now, period, phase=0.0):
+    """Return first slot of grid (period, phase) after now"""
+    return phase + (math.floor((now - phase) / period) + 1) * period
+
+
+class Job(object):
+    """Callback run once per slot, it returns False when it could not do
+    its work in the slot (e.g. previous cycle still running)"""
+
+    def __init__(self, callback, period, phase=0.0):
+        self.callback = callback
+        self.period = period
+        self.phase = phase
+        self.cycles = 0
+        self.missed = 0
+        self.cancelled = False
+
+
+class PollScheduler(object):
+    """Runs jobs at fixed rate on a wall-clock grid in one thread"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.heap = []
+        self.jobs = {}
+        self.sequence = itertools.count()
+        self.thread = None
+
+    def add(self, key, callback, period, phase=0.0):
+        """Schedule callback every period seconds, in slots shifted by
+        phase from the grid, replacing previous job of key"""
+        job = Job(callback, period, phase)
+        with self.condition:
+            self.remove(key)
+            self.jobs[key] = job
+            heapq.heappush(self.heap, (next_slot(time.time(), period, phase),
+                                       next(self.sequence), job))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run,
+                                               name="ADAM scheduler")
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify()
+        return job
+
+    def remove(self, key):
+        """Stop scheduling job of key"""
+        with self.condition:
+            job = self.jobs.pop(key, None)
+            if job is not None:
+                job.cancelled = True
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                slot, number, job = self.heap[0]
+                delay = slot - time.time()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                heapq.heappop(self.heap)
+            if job.cancelled:
+                continue
+            try:
+                done = job.callback()
+            except Exception:
+                done = False
+            job.cycles += 1
+            if done is False:
+                job.missed += 1
+            slot += job.period
+            now = time.time()
+            if slot <= now:
+                skipped = int((now - slot) // job.period) + 1
+                job.missed += skipped
+                slot += skipped * job.period
+            with self.condition:
+                if not job.cancelled:
+                    heapq.heappush(self.heap,
+                                   (slot, next(self.sequence), job))
+
+
+scheduler = PollScheduler()
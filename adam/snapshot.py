@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Raw state of a device published in shared memory.
+
+    A device with SnapshotPath property set (e.g. /dev/shm/adam-6217-1)
+    writes its state store after every acquisition cycle to a memory-mapped
+    file, so processes on the same host read the latest values without
+    going through Tango. The file holds a header, a directory of register
+    groups and a ring of depth slots, each with read timestamps of all
+    groups followed by raw values of groups:
+
+     * header: magic 'ADAM', version, depth, number of groups, slot size,
+       offset of first slot, sequence, number of published snapshots
+     * directory entry: group name, kind ('H' registers, 'B' coils), offset
+       in slot, number of values
+
+    Sequence is a seqlock: it is odd while a snapshot is being written, so
+    a reader which saw the same even sequence before and after reading has
+    a consistent copy. SnapshotReader returns numpy views of the mapped
+    file, without copying.
+"""
+
+import mmap
+import os
+import struct
+
+import numpy
+
+__all__ = ["SnapshotWriter", "SnapshotReader"]
+
+MAGIC = b'ADAM'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIII')
+ENTRY = struct.Struct('<32scxxxII')
+# offsets of uint64 sequence and number of published snapshots
+SEQUENCE = HEADER.size
+HEAD = HEADER.size + 8
+DIRECTORY = HEADER.size + 16
+DTYPES = {b'H': numpy.uint16, b'B': numpy.uint8}
+
+
+def align(offset):
+    return (offset + 7) & ~7
+
+
+class SnapshotWriter(object):
+    """Publishes snapshots of a state store to memory-mapped file"""
+
+    def __init__(self, path, register_groups, depth=1):
+        self.path = path
+        self.depth = max(1, depth)
+        entries = []
+        offset = 8 * len(register_groups)
+        for name, kind, address, count in register_groups:
+            typecode = b'B' if kind == 'coils' else b'H'
+            entries.append((name, typecode, offset, count))
+            offset = align(offset + count * (1 if typecode == b'B' else 2))
+        self.slot_size = offset
+        self.slots = align(DIRECTORY + ENTRY.size * len(entries))
+        size = self.slots + self.depth * self.slot_size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.map[:size] = b'\0' * size
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.depth,
+                         len(entries), self.slot_size, self.slots)
+        for i, (name, typecode, offset, count) in enumerate(entries):
+            ENTRY.pack_into(self.map, DIRECTORY + i * ENTRY.size,
+                            name.encode('ascii'), typecode, offset, count)
+        self.counters = numpy.frombuffer(self.map, numpy.uint64, 2,
+                                         SEQUENCE)
+        self.views = []
+        for slot in range(0, self.depth):
+            base = self.slots + slot * self.slot_size
+            self.views.append((
+                numpy.frombuffer(self.map, numpy.float64, len(entries),
+                                 base),
+                [(name, numpy.frombuffer(self.map, DTYPES[typecode], count,
+                                         base + offset))
+                 for name, typecode, offset, count in entries]))
+
+    def publish(self, state):
+        """Write raw values and timestamps of state store to next slot"""
+        timestamps, groups = self.views[int(self.counters[1]) % self.depth]
+        self.counters[0] += 1
+        timestamps[:] = state.timestamps
+        for name, view in groups:
+            view[:] = getattr(state, name)
+        self.counters[1] += 1
+        self.counters[0] += 1
+
+    def close(self):
+        self.counters = None
+        self.views = []
+        self.map.close()
+
+
+class SnapshotReader(object):
+    """Reads snapshots published by SnapshotWriter of a device"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.depth, groups, slot_size, slots = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not an ADAM snapshot" % path)
+        self.counters = numpy.frombuffer(self.map, numpy.uint64, 2,
+                                         SEQUENCE)
+        entries = [ENTRY.unpack_from(self.map, DIRECTORY + i * ENTRY.size)
+                   for i in range(0, groups)]
+        self.names = [name.rstrip(b'\0').decode('ascii')
+                      for name, typecode, offset, count in entries]
+        self.slots = []
+        for slot in range(0, self.depth):
+            base = slots + slot * slot_size
+            views = {'timestamps': numpy.frombuffer(self.map, numpy.float64,
+                                                    groups, base)}
+            for name, (raw, typecode, offset, count) in zip(self.names,
+                                                            entries):
+                views[name] = numpy.frombuffer(self.map, DTYPES[typecode],
+                                               count, base + offset)
+            self.slots.append(views)
+
+    @property
+    def sequence(self):
+        """Sequence of the seqlock, odd while a snapshot is being written"""
+        return int(self.counters[0])
+
+    @property
+    def count(self):
+        """Number of snapshots published since the writer started"""
+        return int(self.counters[1])
+
+    def latest(self):
+        """Return sequence and views of the latest snapshot (timestamps and
+        arrays of groups by name); the views are valid if valid(sequence)
+        is True after they were used"""
+        while True:
+            sequence = self.sequence
+            if not sequence & 1:
+                return sequence, \
+                    self.slots[(self.count - 1) % self.depth]
+
+    def valid(self, sequence):
+        """Return True if no snapshot was written since sequence was read"""
+        return self.sequence == sequence
+
+    def read(self):
+        """Return consistent copy of the latest snapshot"""
+        while True:
+            sequence, views = self.latest()
+            data = dict((name, view.copy())
+                        for name, view in views.items())
+            if self.valid(sequence):
+                return data
+
+    def history(self):
+        """Return consistent copies of the snapshots in the ring, oldest
+        first"""
+        while True:
+            sequence, views = self.latest()
+            count = self.count
+            data = [dict((name, view.copy()) for name, view in
+                         self.slots[i % self.depth].items())
+                    for i in range(max(0, count - self.depth), count)]
+            if self.valid(sequence):
+                return data
+
+    def close(self):
+        self.counters = None
+        self.slots = []
+        self.map.close()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the dev-solaris-adam project
+#
+#
+#
+# Distributed under the terms of the LGPL license.
+# See LICENSE.txt for more info.
+
+"""
+    Per-device store of raw module state.
+
+    state_class creates, for register groups of a device class, a class with
+    one slot per group holding its raw values in an array ('H' for holding
+    registers, 'B' for coils), plus read timestamps of groups and a
+    generation counter increased on every change. Every device instance
+    owns its own store, so devices of the same class do not share state.
+
+    Times of the last writes of groups are kept as well: a read which
+    returned before the device wrote the group (e.g. a poll queued behind
+    the write) holds values the write replaced and is not stored.
+"""
+
+import time
+from array import array
+
+__all__ = ["StateStore", "state_class"]
+
+
+class StateStore(object):
+    """Base class of state stores created by state_class"""
+
+    __slots__ = ('timestamps', 'written', 'generation')
+    groups = ()
+    index = {}
+
+    def __init__(self):
+        for name, kind, address, count in self.groups:
+            setattr(self, name, array('B' if kind == 'coils' else 'H',
+                                      [0] * count))
+        self.timestamps = array('d', [0.0] * len(self.groups))
+        self.written = array('d', [0.0] * len(self.groups))
+        self.generation = 0
+
+    def update(self, name, data, timestamp=None):
+        """Replace values of group read from module at timestamp, return
+        False if the read is older than the last write of group"""
+        index = self.index[name]
+        timestamp = timestamp or time.time()
+        if timestamp < self.written[index]:
+            return False
+        values = getattr(self, name)
+        values[:] = array(values.typecode, [int(v) for v in data])
+        self.timestamps[index] = timestamp
+        self.generation += 1
+        return True
+
+    def write(self, name, offset, data, timestamp=None):
+        """Replace part of group values with data written to module, whose
+        response arrived before timestamp (default now)"""
+        values = getattr(self, name)
+        values[offset:offset + len(data)] = \
+            array(values.typecode, [int(v) for v in data])
+        self.written[self.index[name]] = timestamp or time.time()
+        self.generation += 1
+
+    def timestamp(self, name):
+        """Return time of last read of group, 0 if it was never read"""
+        return self.timestamps[self.index[name]]
+
+    def bits(self, name, start=0, stop=None):
+        """Return coils of group as list of bools"""
+        return [bool(b) for b in getattr(self, name)[start:stop]]
+
+
+def state_class(name, register_groups):
+    """Create StateStore subclass with slots for given register groups"""
+    return type(name, (StateStore,), {
+        '__slots__': tuple(group[0] for group in register_groups),
+        'groups': tuple(register_groups),
+        'index': dict((group[0], i)
+                      for i, group in enumerate(register_groups)),
+    })
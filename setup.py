@@ -17,5 +17,7 @@ setup(
     install_requires=["setuptools"],
     entry_points={
         "console_scripts": ["ADAM = "
-                            "adam.run_server:main"]}
+                            "adam.run_server:main",
+                            "ADAM-broker = "
+                            "adam.broker:main"]}
 )